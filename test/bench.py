@@ -0,0 +1,251 @@
+"""
+Harness throughput benchmarks
+
+Measures simulated cycles per second of tb_vga, tb_frontend, tb_pixel_core and tb_top, SPI commands per second
+through the BFM, top level and pixel core frames per second, frames per second of the reference model and commands
+per second of the batch SPI command encoder. Results are written to bench/results.json and compared with the baseline
+kept in the repo, every rate more than the threshold below its baseline is flagged and fails the run. A baselined rate
+that was not measured, or a measured rate without a baseline, fails the run as well. Rates are absolute, so the
+baseline stores the host it was measured on and a run on any other host is refused until it stores its own baseline:
+
+    python bench.py                 # measure and compare
+    python bench.py --update        # measure and store as the new baseline
+    python bench.py --no-sim        # reference model only
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import numpy as np
+from raster_model import COVERAGE_CACHE, render_frame, WPX, WPY
+from golden import Scene, render_scene
+from command_stream import SPI_CMD_FIELDS, make_cmds, encode_cmds, decode_cmds
+
+BENCH_DIR = 'bench'
+BASELINE_PATH = 'bench_baseline.json'
+
+# Allowed slowdown against the baseline before a rate is flagged
+BENCH_THRESHOLD = 0.2
+
+# Suite makefile running each benchmarked testbench
+BENCH_SUITES = {'tb_vga': '7', 'tb_frontend': '6', 'tb_pixel_core': '2', 'tb_top': '1'}
+
+# Scenes rendered by the reference model benchmarks
+BENCH_SCENES = 20
+BENCH_REPEATS = 3
+BENCH_SEED = 0
+
+# Commands packed by the encoder benchmark
+BENCH_ENCODE_CMDS = 1000000
+
+
+def host_info() -> dict:
+    """
+    CPU, core count and Python version of this host, rates are only comparable between runs on the same host
+    """
+    cpu = platform.processor()
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo', 'r') as f:
+            models = [line.split(':', 1)[1].strip() for line in f if line.startswith('model name')]
+        if len(models) > 0:
+            cpu = models[0]
+
+    return {'machine': platform.machine(), 'cpu': cpu, 'cpu_count': os.cpu_count(),
+            'python': platform.python_version()}
+
+
+def random_scene(n_slots: int = 4) -> Scene:
+    """
+    Scene of enabled random triangles
+    """
+    vertex = lambda: (random.randrange(1 << WPX), random.randrange(1 << WPY))
+    return Scene(v0=tuple(vertex() for _ in range(n_slots)),
+                 v1=tuple(vertex() for _ in range(n_slots)),
+                 v2=tuple(vertex() for _ in range(n_slots)),
+                 colors=tuple(random.randrange(64) for _ in range(n_slots)),
+                 enables=(True,) * n_slots,
+                 background_color=random.randrange(64))
+
+
+def bench_model() -> dict:
+    """
+    Frames per second of the windowed renderer and of golden frames rendered with a cold coverage cache
+
+    Best of BENCH_REPEATS runs, which keeps the rates steady enough to compare
+    """
+    scenes = [random_scene() for _ in range(BENCH_SCENES)]
+    render_fps = 0.0
+    golden_fps = 0.0
+
+    for _ in range(BENCH_REPEATS):
+        start = time.perf_counter()
+        for scene in scenes:
+            render_frame(np.array(scene.v0), np.array(scene.v1), np.array(scene.v2), scene.colors, scene.enables,
+                         scene.background_color)
+        render_fps = max(render_fps, len(scenes) / (time.perf_counter() - start))
+
+        start = time.perf_counter()
+        for scene in scenes:
+            COVERAGE_CACHE.clear()
+            render_scene(scene)
+        golden_fps = max(golden_fps, len(scenes) / (time.perf_counter() - start))
+
+    COVERAGE_CACHE.clear()
+
+    return {'model.render_frame_fps': render_fps, 'model.golden_cold_fps': golden_fps}
+
+
+def bench_encoder() -> dict:
+    """
+    Commands per second through the batch SPI command encoder and decoder
+    """
+    cmds = make_cmds(BENCH_ENCODE_CMDS)
+    for name, _, width in SPI_CMD_FIELDS:
+        cmds[name] = np.random.randint(0, 1 << width, size=len(cmds))
+
+    encode_rate = 0.0
+    decode_rate = 0.0
+    for _ in range(BENCH_REPEATS):
+        start = time.perf_counter()
+        wire = encode_cmds(cmds)
+        encode_rate = max(encode_rate, len(cmds) / (time.perf_counter() - start))
+
+        start = time.perf_counter()
+        decode_cmds(wire)
+        decode_rate = max(decode_rate, len(cmds) / (time.perf_counter() - start))
+
+    return {'spi.encode_cmds_per_s': encode_rate, 'spi.decode_cmds_per_s': decode_rate}
+
+
+def bench_sim(make_args: list) -> dict:
+    """
+    Run bench_sim against every benchmarked testbench and collect the measured rates
+
+    Raises RuntimeError naming every testbench that failed to build or recorded no rates
+    """
+    metrics_path = os.path.join(BENCH_DIR, 'metrics.json')
+    if os.path.exists(metrics_path):
+        os.remove(metrics_path)
+
+    env = dict(os.environ, BENCH_RESULTS=os.path.abspath(metrics_path))
+    failed = []
+    for toplevel, suite in BENCH_SUITES.items():
+        result = subprocess.run(['make', '-f', 'Makefile.' + suite, 'MODULE=bench_sim', 'TESTCASE=', 'SAVE_IMGS=False',
+                                 'COCOTB_RESULTS_FILE=' + os.path.join(BENCH_DIR, 'results_' + toplevel + '.xml')]
+                                + make_args, env=env)
+        if result.returncode != 0:
+            failed.append(toplevel)
+
+    metrics = {}
+    if os.path.exists(metrics_path):
+        with open(metrics_path, 'r') as f:
+            metrics = json.load(f)
+
+    # make succeeds even when a test fails, a testbench that recorded nothing failed as well
+    for toplevel in BENCH_SUITES:
+        if toplevel not in failed and not any(name.startswith(toplevel + '.') for name in metrics):
+            failed.append(toplevel)
+
+    if len(failed) > 0:
+        raise RuntimeError("Simulator benchmarks failed for " + ", ".join(failed))
+    return metrics
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Describe every rate that dropped more than threshold below its baseline
+
+    Rates missing from either side are returned as well, a baseline that no longer covers what is measured fails
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            print("{:<30} {:>14.1f}  (no baseline)".format(name, results[name]))
+            regressions.append(name)
+            continue
+
+        ratio = results[name] / baseline[name]
+        flag = ratio < 1 - threshold
+        print("{:<30} {:>14.1f} {:>14.1f} {:>7.1%}{}".format(name, results[name], baseline[name], ratio - 1,
+                                                               "  SLOWER" if flag else ""))
+        if flag:
+            regressions.append(name)
+
+    for name in sorted(set(baseline) - set(results)):
+        print("{:<30} {:>14} {:>14.1f}  (not measured)".format(name, '-', baseline[name]))
+        regressions.append(name)
+
+    return regressions
+
+
+def main(args) -> int:
+    os.makedirs(BENCH_DIR, exist_ok=True)
+
+    # Same scenes on every run
+    random.seed(BENCH_SEED)
+    results = bench_model()
+    results.update(bench_encoder())
+    if not args.no_sim:
+        try:
+            results.update(bench_sim(args.make_args))
+        except RuntimeError as e:
+            print(e)
+            return 1
+
+    results = {name: round(rate, 1) for name, rate in results.items()}
+    with open(os.path.join(BENCH_DIR, 'results.json'), 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    host = host_info()
+    baseline = {}
+    baseline_host = None
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, 'r') as f:
+            stored = json.load(f)
+        # A baseline without a host is from an unknown one
+        baseline = stored.get('rates', {})
+        baseline_host = stored.get('host')
+
+    # Simulator rates are only expected when the simulators ran, an update without them keeps the stored ones
+    # measured on this host
+    sim_baseline = {name: rate for name, rate in baseline.items() if name.split('.')[0] in BENCH_SUITES}
+    if args.no_sim:
+        baseline = {name: rate for name, rate in baseline.items() if name not in sim_baseline}
+
+    if args.update:
+        if args.no_sim and baseline_host == host:
+            results.update(sim_baseline)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({'host': host, 'rates': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print("Baseline written to " + BASELINE_PATH)
+        return 0
+
+    if baseline_host != host:
+        print("Baseline was measured on " + json.dumps(baseline_host, sort_keys=True) + ", this host is "
+              + json.dumps(host, sort_keys=True))
+        print("Rates are not comparable across hosts, store a baseline for this host with --update")
+        return 1
+
+    regressions = compare(results, baseline, args.threshold)
+    if len(regressions) > 0:
+        print("{} rates more than {:.0%} below baseline or missing from it".format(len(regressions), args.threshold))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Harness throughput benchmarks")
+    parser.add_argument('--update', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--no-sim', action='store_true', help="only benchmark the reference model")
+    parser.add_argument('--threshold', type=float, default=BENCH_THRESHOLD, help="allowed slowdown, as a fraction")
+    parser.add_argument('make_args', nargs='*', help="extra make arguments for the simulator runs, e.g. SIM=verilator")
+    sys.exit(main(parser.parse_args()))
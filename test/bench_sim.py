@@ -0,0 +1,166 @@
+"""
+Simulation throughput benchmarks
+
+Run against a suite testbench by bench.py with MODULE=bench_sim, each benchmark only runs under its own TOPLEVEL.
+Measured rates are merged into the JSON file named by BENCH_RESULTS
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles, Timer
+from cocotb.utils import get_sim_time
+import json
+import os
+import random
+import time
+import numpy as np
+import shared_utils as shared
+from shared_utils import SPIcmd, SPIMaster, sweep_frame
+
+BENCH_RESULTS_PATH = os.environ.get('BENCH_RESULTS', 'bench/metrics.json')
+
+# Clock cycles run by the free running benchmarks
+BENCH_CYCLES = int(os.environ.get('BENCH_CYCLES', 200000))
+
+# Commands streamed by the SPI benchmark
+BENCH_SPI_CMDS = 500
+
+# Frames drawn by the top level benchmark
+BENCH_FRAMES = 2
+
+CLOCK_PERIOD = 40
+
+
+def skip_unless(toplevel: str) -> bool:
+    """
+    Skip condition for benchmarks of another testbench
+    """
+    return os.environ.get('TOPLEVEL') != toplevel
+
+
+def record(metrics: dict):
+    """
+    Merge measured rates into the results file
+    """
+    results = {}
+    if os.path.exists(BENCH_RESULTS_PATH):
+        with open(BENCH_RESULTS_PATH, 'r') as f:
+            results = json.load(f)
+
+    results.update(metrics)
+
+    os.makedirs(os.path.dirname(BENCH_RESULTS_PATH) or '.', exist_ok=True)
+    with open(BENCH_RESULTS_PATH, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+class Stopwatch:
+    """
+    Wall clock and simulated time elapsed over a section of a benchmark
+    """
+    def __init__(self):
+        self.wall_start = time.perf_counter()
+        self.sim_start = get_sim_time(units='ns')
+
+    def wall(self) -> float:
+        return time.perf_counter() - self.wall_start
+
+    def cycles(self) -> float:
+        return (get_sim_time(units='ns') - self.sim_start) / CLOCK_PERIOD
+
+
+async def reset(dut):
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 10)
+    dut.rst_n.value = 1
+    await ClockCycles(dut.clk, 1)
+
+
+@cocotb.test(skip=skip_unless('tb_vga'))
+async def bench_vga(dut):
+    """
+    Free running VGA timing generator
+    """
+    cocotb.start_soon(Clock(dut.clk, CLOCK_PERIOD, units='ns').start())
+    await reset(dut)
+
+    watch = Stopwatch()
+    await ClockCycles(dut.clk, BENCH_CYCLES)
+
+    record({'tb_vga.cycles_per_s': watch.cycles() / watch.wall()})
+
+
+@cocotb.test(skip=skip_unless('tb_frontend'))
+async def bench_frontend(dut):
+    """
+    Idle frontend clocking, then a stream of commands through the SPI master BFM
+    """
+    cocotb.start_soon(Clock(dut.clk, CLOCK_PERIOD, units='ns').start())
+    dut.cs_in.value = 1
+    dut.mosi_in.value = 0
+    dut.sck_in.value = 0
+    dut.en_load.value = 1
+    await reset(dut)
+
+    watch = Stopwatch()
+    await ClockCycles(dut.clk, BENCH_CYCLES)
+    cycles_per_s = watch.cycles() / watch.wall()
+
+    cmds = [SPIcmd.generate_random(random.choice([shared.SPI_CMD_WRITE_POLY_A, shared.SPI_CMD_WRITE_POLY_B]))
+            for _ in range(BENCH_SPI_CMDS)]
+    spi = SPIMaster(dut.spi_bfm, cocotb.plusargs.get('spi_file', 'tb_frontend_spi.hex'))
+
+    watch = Stopwatch()
+    await spi.send(cmds)
+
+    record({'tb_frontend.cycles_per_s': cycles_per_s,
+            'tb_frontend.spi_cmds_per_s': len(cmds) / watch.wall()})
+
+
+@cocotb.test(skip=skip_unless('tb_pixel_core'))
+async def bench_pixel_core(dut):
+    """
+    One full frame sweep of the pixel core with every slot enabled
+    """
+    from test_pixel_core import PCPolygon, set_polygons, SWEEP_PATH
+
+    cocotb.start_soon(Clock(dut.clk, CLOCK_PERIOD, units='ns').start())
+    await reset(dut)
+
+    set_polygons(dut, {slot: PCPolygon(v0=np.array([random.randrange(640), random.randrange(480)]),
+                                       v1=np.array([random.randrange(640), random.randrange(480)]),
+                                       v2=np.array([random.randrange(640), random.randrange(480)]),
+                                       color=random.randrange(64), enable=True)
+                       for slot in range(4)})
+    dut.background_color.value = 0
+    await Timer(CLOCK_PERIOD, units='ns')
+
+    watch = Stopwatch()
+    await sweep_frame(dut, SWEEP_PATH)
+
+    record({'tb_pixel_core.cycles_per_s': watch.cycles() / watch.wall(),
+            'tb_pixel_core.frames_per_s': 1 / watch.wall()})
+
+
+@cocotb.test(skip=skip_unless('tb_top'))
+async def bench_top(dut):
+    """
+    Top level frames with the native clock and the capture monitor checking every frame
+    """
+    from test_top import VGAScreen, reset_device
+
+    screen = VGAScreen(dut=dut, clk_signal=dut.clk)
+    cocotb.start_soon(screen.clock())
+    await reset_device(dut, screen=screen)
+
+    watch = Stopwatch()
+    while screen.frame_count < BENCH_FRAMES:
+        await Timer(CLOCK_PERIOD * 1000, units='ns')
+
+    record({'tb_top.cycles_per_s': watch.cycles() / watch.wall(),
+            'tb_top.frames_per_s': screen.frame_count / watch.wall()})
+
+    await screen.check_remaining()
@@ -0,0 +1,20 @@
+# Content hashed RTL build directory, shared by every suite makefile
+#
+# The build lives in sim_build/cache/<toplevel>_<sim>_<hash> and is reused for as long as the Verilog sources,
+# include files, defines, testbench and simulator version are unchanged, see build_key.py. SIM_BUILD given on the
+# command line, BUILD_CACHE=0 or gate level simulation keep the fixed build directory
+
+BUILD_CACHE ?= 1
+
+ifeq ($(BUILD_CACHE),1)
+ifneq ($(GATES),yes)
+ifneq ($(origin SIM_BUILD),command line)
+SIM_BUILD := $(shell python $(PWD)/build_key.py $(SIM) $(TOPLEVEL) $(COMPILE_ARGS) $(EXTRA_ARGS) -- $(VERILOG_SOURCES))
+endif
+endif
+endif
+
+# Compile without running any test, used to warm the build before running shards of a suite
+.DEFAULT_GOAL := all
+
+build: $(if $(filter verilator,$(SIM)),$(SIM_BUILD)/Vtop,$(SIM_BUILD)/sim.vvp)
@@ -0,0 +1,109 @@
+"""
+Content hashed simulator build directories
+
+Prints the build directory for a set of Verilog sources, compile arguments, testbench top level and simulator. The
+directory name is a hash of the source contents (and of every Verilog file in the include directories), the arguments,
+the simulator version and the cocotb version, so a build is reused for as long as none of them changed:
+
+    python build_key.py icarus tb_top -I../src -- ../src/top.v tb_top.v
+
+The least recently used directories beyond BUILD_CACHE_KEEP (16 by default) are removed
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import glob
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+
+BUILD_CACHE_PATH = 'sim_build/cache'
+BUILD_CACHE_KEEP = 16
+
+# Commands printing the version of each simulator
+SIM_VERSION_CMDS = {'icarus': ['iverilog', '-V'],
+                    'verilator': ['verilator', '--version']}
+
+INCLUDE_SUFFIXES = ('.v', '.vh', '.sv', '.svh')
+
+
+def sim_version(sim: str) -> str:
+    """
+    First line of the simulator version banner, empty if the simulator cannot be run
+    """
+    try:
+        out = subprocess.run(SIM_VERSION_CMDS[sim], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             universal_newlines=True).stdout
+    except (KeyError, OSError):
+        return ''
+    return out.splitlines()[0] if out else ''
+
+
+def include_dirs(args: list) -> list:
+    """
+    Include directories given to the compiler as -I<dir> or +incdir+<dir>
+    """
+    dirs = []
+    for arg in args:
+        if arg.startswith('-I'):
+            dirs.append(arg[2:])
+        elif arg.startswith('+incdir+'):
+            dirs.extend(arg[len('+incdir+'):].split('+'))
+    return [d for d in dirs if d]
+
+
+def build_key(sim: str, toplevel: str, args: list, sources: list) -> str:
+    """
+    Hash of everything a simulator build depends on
+    """
+    import cocotb
+
+    h = hashlib.sha256()
+    for part in [sim, sim_version(sim), cocotb.__version__, toplevel] + args:
+        h.update(part.encode() + b'\0')
+
+    # Included files are picked up by content too, sources listed twice are only hashed once
+    files = list(sources)
+    for include_dir in include_dirs(args):
+        files += sorted(path for path in glob.glob(os.path.join(include_dir, '*')) if path.endswith(INCLUDE_SUFFIXES))
+
+    seen = set()
+    for path in files:
+        real = os.path.realpath(path)
+        if real in seen:
+            continue
+        seen.add(real)
+
+        h.update(path.encode() + b'\0')
+        with open(path, 'rb') as f:
+            h.update(hashlib.sha256(f.read()).digest())
+
+    return h.hexdigest()[:16]
+
+
+def prune(cache_path: str, keep: int):
+    """
+    Remove the least recently used build directories beyond keep
+    """
+    dirs = sorted(glob.glob(os.path.join(cache_path, '*')), key=os.path.getmtime, reverse=True)
+    for path in dirs[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main(sim: str, toplevel: str, args: list, sources: list) -> str:
+    path = os.path.join(BUILD_CACHE_PATH, '{}_{}_{}'.format(toplevel, sim, build_key(sim, toplevel, args, sources)))
+
+    # Touching the directory marks it as recently used
+    os.makedirs(path, exist_ok=True)
+    os.utime(path)
+    prune(BUILD_CACHE_PATH, int(os.environ.get('BUILD_CACHE_KEEP') or BUILD_CACHE_KEEP))
+
+    return path
+
+
+if __name__ == '__main__':
+    split = sys.argv.index('--')
+    print(main(sys.argv[1], sys.argv[2], sys.argv[3:split], sys.argv[split + 1:]))
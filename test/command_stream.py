@@ -0,0 +1,274 @@
+"""
+Batched SPI command encoding
+
+Commands are held as structured arrays of their fields and packed into the 7 byte little endian wire format of
+SPIcmd in one vectorized operation, bit 0 of byte 0 going out first on MOSI. Nothing here needs a simulator, so a
+host can feed the same buffers to real hardware
+
+Recorded scenes and animations are stored as command stream files, all little endian:
+
+    header  magic, format version, record size, frame count and offset of the frame index (STREAM_HEADER)
+    data    wire records of every frame back to back, padded to 8 bytes
+    index   first record and record count of each frame (STREAM_INDEX_DTYPE)
+
+Each frame holds the commands sent in one blanking period. The reader memory maps the file and hands out frames as
+(N, 7) views of the mapping, so long captures replay without being loaded. A host streams them to the device with
+
+    with CommandStreamReader(path) as stream:
+        for wire in stream:
+            spi.writebytes(wire.tobytes())
+
+or from the command line, python command_stream.py <file> lists the frames of a stream
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import numpy as np
+
+# Bytes per command on the wire
+SPI_CMD_BYTES = 7
+
+# (field, bit offset, width) of a command word, see SPIcmd
+SPI_CMD_FIELDS = (('cmd', 0, 8),
+                  ('color', 8, 6),
+                  ('v0_x', 14, 7),
+                  ('v1_x', 21, 7),
+                  ('v2_x', 28, 7),
+                  ('v0_y', 35, 6),
+                  ('v1_y', 41, 6),
+                  ('v2_y', 47, 6))
+
+SPI_CMD_DTYPE = np.dtype([(name, np.uint8) for name, _, _ in SPI_CMD_FIELDS])
+
+# Command stream file header, magic, version, record size, reserved, frame count, index offset
+STREAM_MAGIC = b'BGPUCMD\0'
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct('<8sHHIQQ')
+
+# First record and record count of each frame
+STREAM_INDEX_DTYPE = np.dtype([('first', '<u8'), ('count', '<u8')])
+
+
+def make_cmds(n_cmds: int) -> np.ndarray:
+    """
+    Zeroed structured array of n_cmds commands
+    """
+    return np.zeros(n_cmds, dtype=SPI_CMD_DTYPE)
+
+
+def encode_cmds(cmds: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    Pack a structured array of commands into an (N, 7) uint8 buffer of wire bytes, written into out if given
+    """
+    words = np.zeros(len(cmds), dtype=np.uint64)
+    for name, offset, width in SPI_CMD_FIELDS:
+        field = cmds[name]
+        if width < 8:
+            assert not np.any(field >> width), "Field " + name + " does not fit in " + str(width) + " bits"
+        words |= field.astype(np.uint64) << np.uint64(offset)
+
+    # Little endian words, the top byte is always zero
+    wire = words.astype('<u8', copy=False).view(np.uint8).reshape(len(cmds), 8)[:, :SPI_CMD_BYTES]
+
+    if out is None:
+        return np.ascontiguousarray(wire)
+
+    out[...] = wire
+    return out
+
+
+def decode_cmds(buf) -> np.ndarray:
+    """
+    Unpack wire bytes (bytes, memoryview or uint8 array) of N commands into a structured array
+    """
+    wire = np.frombuffer(buf, dtype=np.uint8) if not isinstance(buf, np.ndarray) else buf.reshape(-1)
+    assert len(wire) % SPI_CMD_BYTES == 0, "Buffer does not hold whole commands"
+    n_cmds = len(wire) // SPI_CMD_BYTES
+
+    padded = np.zeros((n_cmds, 8), dtype=np.uint8)
+    padded[:, :SPI_CMD_BYTES] = wire.reshape(n_cmds, SPI_CMD_BYTES)
+    words = padded.view('<u8').reshape(n_cmds)
+
+    cmds = make_cmds(n_cmds)
+    for name, offset, width in SPI_CMD_FIELDS:
+        cmds[name] = (words >> np.uint64(offset)) & np.uint64((1 << width) - 1)
+    return cmds
+
+
+def is_wire(cmds) -> bool:
+    """
+    Check if commands are given as an (N, 7) buffer of wire bytes rather than a structured array
+    """
+    return isinstance(cmds, np.ndarray) and cmds.dtype == np.uint8 and cmds.ndim == 2
+
+
+def wire_to_memh(wire: np.ndarray) -> str:
+    """
+    One 56 bit command word in hex per line from an (N, 7) buffer of wire bytes
+    """
+    text = wire[:, ::-1].tobytes().hex()
+    width = SPI_CMD_BYTES * 2
+    return ''.join(text[i:i + width] + '\n' for i in range(0, len(text), width))
+
+
+def cmds_to_memh(cmds: np.ndarray) -> str:
+    """
+    One 56 bit command word in hex per line, as read by $readmemh in spi_master_bfm.v
+    """
+    return wire_to_memh(encode_cmds(cmds))
+
+
+class CommandStreamWriter:
+    """
+    Write a command stream file one frame at a time
+
+    The frame index and final header are written on close, a stream that was never closed reads back as empty
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.frames = []
+        self.n_records = 0
+        self.file = open(path, 'wb')
+        self.file.write(STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, SPI_CMD_BYTES, 0, 0, STREAM_HEADER.size))
+
+    def write_frame(self, cmds):
+        """
+        Append the commands of one frame, a structured array or (N, 7) wire bytes, empty frames are allowed
+        """
+        wire = cmds if is_wire(cmds) else encode_cmds(cmds)
+        assert wire.shape[1] == SPI_CMD_BYTES, "Commands are not " + str(SPI_CMD_BYTES) + " byte records"
+
+        self.file.write(np.ascontiguousarray(wire).tobytes())
+        self.frames.append((self.n_records, len(wire)))
+        self.n_records += len(wire)
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        # Keep the index aligned for the reader
+        data_end = STREAM_HEADER.size + self.n_records * SPI_CMD_BYTES
+        index_offset = (data_end + 7) // 8 * 8
+        self.file.write(bytes(index_offset - data_end))
+        self.file.write(np.array(self.frames, dtype=STREAM_INDEX_DTYPE).tobytes())
+
+        self.file.seek(0)
+        self.file.write(STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, SPI_CMD_BYTES, 0, len(self.frames),
+                                           index_offset))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CommandStreamReader:
+    """
+    Memory mapped command stream file, frames are zero copy (N, 7) views of wire bytes
+
+    Each view holds a reference to the mapping, so frames stay valid after the reader is closed
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = None
+        index = first = count = None
+
+        # The file and the mapping are closed again if the stream does not validate
+        try:
+            # mmap refuses empty files, check the size first so every short file gets the same error
+            size = os.fstat(self.file.fileno()).st_size
+            assert size >= STREAM_HEADER.size, path + " is too short for a command stream header"
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            magic, version, record_bytes, _, n_frames, index_offset = STREAM_HEADER.unpack_from(self.map)
+            assert magic == STREAM_MAGIC, path + " is not a command stream"
+            assert version == STREAM_VERSION, path + " is command stream version " + str(version) + ", expected " + \
+                str(STREAM_VERSION)
+            assert record_bytes == SPI_CMD_BYTES, path + " holds " + str(record_bytes) + " byte records"
+
+            assert STREAM_HEADER.size <= index_offset and \
+                index_offset + n_frames * STREAM_INDEX_DTYPE.itemsize <= len(self.map), path + " is truncated"
+
+            index = np.frombuffer(self.map, dtype=STREAM_INDEX_DTYPE, count=n_frames, offset=index_offset)
+
+            # Every frame has to lie within the data section
+            data_records = (index_offset - STREAM_HEADER.size) // SPI_CMD_BYTES
+            first = index['first']
+            count = index['count']
+            bad = np.flatnonzero((first > data_records) | (count > data_records - np.minimum(first, data_records)))
+            assert len(bad) == 0, path + " has " + str(len(bad)) + " frames outside its data, the first is frame " + \
+                str(bad[0])
+        except BaseException:
+            # Views of the mapping have to go before it can be closed
+            index = first = count = None
+            if self.map is not None:
+                self.map.close()
+            self.file.close()
+            raise
+
+        self.version = version
+        self.index = index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def n_records(self) -> int:
+        return int(self.index['count'].sum())
+
+    def frame(self, index: int) -> np.ndarray:
+        """
+        Wire bytes of one frame, a read only view of the mapping
+        """
+        first, count = self.index[index]
+        return np.frombuffer(self.map, dtype=np.uint8, count=int(count) * SPI_CMD_BYTES,
+                             offset=STREAM_HEADER.size + int(first) * SPI_CMD_BYTES).reshape(int(count), SPI_CMD_BYTES)
+
+    def frame_cmds(self, index: int) -> np.ndarray:
+        """
+        Decoded commands of one frame
+        """
+        return decode_cmds(self.frame(index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.frame(index)
+
+    def close(self):
+        """
+        Release the file, the mapping is unmapped once every frame view handed out has been released as well
+        """
+        self.index = None
+        self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(path: str) -> int:
+    with CommandStreamReader(path) as stream:
+        print("{}: version {}, {} frames, {} commands".format(path, stream.version, len(stream), stream.n_records))
+        for index in range(len(stream)):
+            cmds = stream.frame_cmds(index)
+            print("frame {:>6} {:>5} commands {}".format(index, len(cmds), ' '.join('{:02x}'.format(c)
+                                                                                    for c in cmds['cmd'])))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="List the frames of a command stream file")
+    parser.add_argument('path', help="command stream file")
+    sys.exit(main(parser.parse_args().path))
@@ -0,0 +1,80 @@
+"""
+Integer fixed point helpers
+
+Q format conversions for arbitrary (n_word, n_frac) that work on scalars and NumPy arrays alike
+Words are limited to 63 bits so everything stays in int64
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+
+
+def _bounds(n_word: int, signed: bool) -> tuple:
+    """
+    Smallest and largest integer representable in n_word bits
+    """
+    if signed:
+        return -(1 << (n_word - 1)), (1 << (n_word - 1)) - 1
+    return 0, (1 << n_word) - 1
+
+
+def to_unsigned(val, n_word: int) -> np.ndarray:
+    """
+    Truncate integers to their n_word bit pattern
+    """
+    return np.bitwise_and(np.asarray(val, dtype=np.int64), (1 << n_word) - 1)
+
+
+def to_signed(val, n_word: int) -> np.ndarray:
+    """
+    Truncate integers to n_word bits and reinterpret them as two's complement
+    """
+    val = to_unsigned(val, n_word)
+    return np.where(val >= (1 << (n_word - 1)), val - (1 << n_word), val)
+
+
+def wrap(val, n_word: int, signed: bool = True) -> np.ndarray:
+    """
+    Wrap integers into the range of an n_word bit word, as hardware overflow does
+    """
+    if signed:
+        return to_signed(val, n_word)
+    return to_unsigned(val, n_word)
+
+
+def saturate(val, n_word: int, signed: bool = True) -> np.ndarray:
+    """
+    Clamp integers into the range of an n_word bit word
+    """
+    low, high = _bounds(n_word, signed)
+    return np.clip(np.asarray(val, dtype=np.int64), low, high)
+
+
+def encode(x, n_word: int, n_frac: int, signed: bool = True, overflow: str = 'saturate') -> np.ndarray:
+    """
+    Encode real values into n_word bit patterns with n_frac fractional bits
+
+    Values are truncated towards -inf, out of range values saturate or wrap depending on overflow
+    """
+    raw = np.floor(np.asarray(x, dtype=np.float64) * float(1 << n_frac))
+
+    if overflow == 'saturate':
+        low, high = _bounds(n_word, signed)
+        raw = np.clip(raw, low, high)
+    elif overflow != 'wrap':
+        raise ValueError("Unknown overflow mode: " + str(overflow))
+
+    return to_unsigned(raw.astype(np.int64), n_word)
+
+
+def decode(bits, n_word: int, n_frac: int, signed: bool = True) -> np.ndarray:
+    """
+    Decode n_word bit patterns with n_frac fractional bits into real values
+    """
+    if signed:
+        val = to_signed(bits, n_word)
+    else:
+        val = to_unsigned(bits, n_word)
+    return val / float(1 << n_frac)
@@ -0,0 +1,130 @@
+"""
+Reader for frames captured by tb_top
+
+The testbench streams one 32 bit record per clock, see the capture block in tb_top.v. Records are memory mapped and
+sliced into whole frames of 6 bit color indices and sync signals, so nothing is read through the GPI per pixel
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import mmap
+import os
+import numpy as np
+from raster_model import FRAME_WIDTH, FRAME_HEIGHT
+
+CAPTURE_PATH = 'tb_top_capture.bin'
+
+# VGA timing, see vga.v
+LINE_CYCLES = 800
+FRAME_LINES = 525
+FRAME_CYCLES = LINE_CYCLES * FRAME_LINES
+HSYNC_START = 656
+HSYNC_END = 751
+VSYNC_START = 490
+VSYNC_END = 491
+
+# Record fields
+COLOR_MASK = 0x3F
+HSYNC_BIT = 6
+VSYNC_BIT = 7
+INT_BIT = 8
+
+
+def expected_sync(first: int, n_records: int) -> tuple:
+    """
+    Expected (hsync, vsync, int_out) for n_records records starting at record first
+    """
+    pos = (np.arange(first, first + n_records, dtype=np.int64)) % FRAME_CYCLES
+    row, col = np.divmod(pos, LINE_CYCLES)
+
+    hsync = ~((col >= HSYNC_START) & (col <= HSYNC_END))
+    vsync = ~((row >= VSYNC_START) & (row <= VSYNC_END))
+    int_out = row >= FRAME_HEIGHT
+
+    return hsync, vsync, int_out
+
+
+def pack_record(color: int, hsync: int, vsync: int, int_out: int) -> int:
+    """
+    Pack sampled outputs into a record, as the testbench writes them
+    """
+    return (color & COLOR_MASK) | (hsync << HSYNC_BIT) | (vsync << VSYNC_BIT) | (int_out << INT_BIT)
+
+
+def visible_frame(records: np.ndarray) -> np.ndarray:
+    """
+    Frame of 6 bit color indices from the records of a visible region, starting at its first pixel
+    """
+    lines = records[:FRAME_HEIGHT * LINE_CYCLES].reshape(FRAME_HEIGHT, LINE_CYCLES)
+    return (lines[:, :FRAME_WIDTH] & COLOR_MASK).astype(np.uint8)
+
+
+def sync_errors(records: np.ndarray, first: int) -> dict:
+    """
+    Count records whose hsync, vsync or int_out differ from the VGA timing, the first record is at position first
+    """
+    hsync = ((records >> HSYNC_BIT) & 1).astype(bool)
+    vsync = ((records >> VSYNC_BIT) & 1).astype(bool)
+    int_out = ((records >> INT_BIT) & 1).astype(bool)
+    exp_hsync, exp_vsync, exp_int = expected_sync(first, len(records))
+
+    return {'hsync': int(np.count_nonzero(hsync != exp_hsync)),
+            'vsync': int(np.count_nonzero(vsync != exp_vsync)),
+            'int_out': int(np.count_nonzero(int_out != exp_int))}
+
+
+class FrameCapture:
+    """
+    Memory mapped view of a capture file, record k is the cycle at linear screen position k since reset
+    """
+    def __init__(self, path: str = CAPTURE_PATH):
+        self.path = path
+
+    def records(self, first: int = 0, last: int = None) -> np.ndarray:
+        """
+        Records [first, last) flushed so far, all of them by default
+
+        Only the pages holding the range are mapped, the returned view keeps its mapping open until it is released
+        """
+        available = len(self)
+        if last is None:
+            last = available
+        assert last <= available, "Records up to " + str(last) + " have not been captured"
+        if last <= first:
+            return np.zeros(0, dtype=np.uint32)
+
+        # Mappings start on an allocation boundary
+        start = first * 4 // mmap.ALLOCATIONGRANULARITY * mmap.ALLOCATIONGRANULARITY
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), last * 4 - start, offset=start, access=mmap.ACCESS_READ)
+
+        return np.frombuffer(mm, dtype='<u4', count=last - first, offset=first * 4 - start)
+
+    def __len__(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // 4
+
+    def frame(self, index: int, records: np.ndarray = None) -> np.ndarray:
+        """
+        Visible region of frame index as a (480, 640) frame of 6 bit color indices
+        """
+        first = index * FRAME_CYCLES
+        last = first + FRAME_HEIGHT * LINE_CYCLES
+        if records is None:
+            assert len(self) >= last, "Frame " + str(index) + " has not been captured"
+            return visible_frame(self.records(first, last))
+
+        assert len(records) >= last, "Frame " + str(index) + " has not been captured"
+        return visible_frame(records[first:last])
+
+    def sync_errors(self, first: int, last: int, records: np.ndarray = None) -> dict:
+        """
+        Count records in [first, last) whose hsync, vsync or int_out differ from the VGA timing
+        """
+        if records is None:
+            return sync_errors(self.records(first, last), first)
+
+        assert len(records) >= last, "Records up to " + str(last) + " have not been captured"
+        return sync_errors(records[first:last], first)
@@ -0,0 +1,322 @@
+"""
+Golden frame service
+
+Ground truth frames are rendered from scene descriptions in a pool of worker processes, so reference computation
+overlaps with simulation. Scenes are submitted as soon as polygons are committed and checkers collect the
+resulting frame at frame end.
+
+The number of workers defaults to the core count and can be set with GOLDEN_WORKERS, 0 renders inline. Workers are
+forked from the simulator process and joined at exit, without fork every frame is rendered inline
+
+Rendered frames are kept in a content addressed store on disk, keyed by the scene and the model version, so warm
+runs skip reference rendering entirely. The store lives in GOLDEN_STORE (golden_store/ next to this file by default)
+and is bounded to GOLDEN_STORE_MB megabytes, 0 disables it
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import ast
+import atexit
+import hashlib
+import multiprocessing
+import os
+import tempfile
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+from raster_model import COVERAGE_CACHE, composite_frame, quantize_vertex, FRAME_WIDTH, FRAME_HEIGHT
+
+# Polygon slots as compressed register fields, slot 0 has the highest priority
+Scene = namedtuple('Scene', ['v0', 'v1', 'v2', 'colors', 'enables', 'background_color'])
+
+# Store defaults
+GOLDEN_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden_store')
+GOLDEN_STORE_MB = 64
+
+
+def _model_sources() -> list:
+    """
+    This file and every local module it imports, directly or through other local modules
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    sources = []
+    pending = [os.path.abspath(__file__)]
+    while len(pending) > 0:
+        path = pending.pop()
+        if path in sources:
+            continue
+        sources.append(path)
+
+        with open(path, 'r') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module is not None:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module = os.path.join(here, name.split('.')[0] + '.py')
+                if os.path.exists(module):
+                    pending.append(module)
+
+    return sorted(sources)
+
+
+def _model_version() -> str:
+    """
+    Digest of the reference model sources, any change to them invalidates stored frames
+    """
+    digest = hashlib.sha256()
+    for path in _model_sources():
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+MODEL_VERSION = _model_version()
+
+
+def make_scene(polys: list, background_color: int) -> Scene:
+    """
+    Describe a list of polygon slots, highest priority first, as a hashable and picklable scene
+
+    Empty (None) or disabled slots are stored zeroed and disabled
+    """
+    v0 = []
+    v1 = []
+    v2 = []
+    colors = []
+    enables = []
+
+    for poly in polys:
+        if poly is not None and poly.enable:
+            v0.append(tuple(int(c) for c in quantize_vertex(poly.v0)))
+            v1.append(tuple(int(c) for c in quantize_vertex(poly.v1)))
+            v2.append(tuple(int(c) for c in quantize_vertex(poly.v2)))
+            colors.append(int(poly.raw_color))
+            enables.append(True)
+        else:
+            v0.append((0, 0))
+            v1.append((0, 0))
+            v2.append((0, 0))
+            colors.append(0)
+            enables.append(False)
+
+    return Scene(tuple(v0), tuple(v1), tuple(v2), tuple(colors), tuple(enables), int(background_color))
+
+
+def render_scene(scene: Scene) -> np.ndarray:
+    """
+    Render a scene into a frame of 6 bit color indices
+
+    Masks come from the coverage cache of the process doing the work, which stays warm across frames
+    """
+    masks = np.zeros((len(scene.enables), FRAME_HEIGHT, FRAME_WIDTH), dtype=bool)
+
+    for slot, enable in enumerate(scene.enables):
+        if enable:
+            masks[slot] = COVERAGE_CACHE.get(scene.v0[slot], scene.v1[slot], scene.v2[slot])
+
+    return composite_frame(masks, scene.colors, scene.enables, scene.background_color)
+
+
+def pack_indices(frame: np.ndarray) -> np.ndarray:
+    """
+    Pack a frame of 6 bit color indices, four pixels to three bytes
+    """
+    idx = frame.reshape(-1, 4).astype(np.uint32) & 0x3F
+    word = idx[:, 0] | (idx[:, 1] << 6) | (idx[:, 2] << 12) | (idx[:, 3] << 18)
+    return np.stack([word & 0xFF, (word >> 8) & 0xFF, (word >> 16) & 0xFF], axis=-1).astype(np.uint8)
+
+
+def unpack_indices(packed: np.ndarray, shape: tuple) -> np.ndarray:
+    """
+    Unpack a frame of 6 bit color indices packed by pack_indices
+    """
+    packed = packed.astype(np.uint32)
+    word = packed[:, 0] | (packed[:, 1] << 8) | (packed[:, 2] << 16)
+    idx = np.stack([word & 0x3F, (word >> 6) & 0x3F, (word >> 12) & 0x3F, (word >> 18) & 0x3F], axis=-1)
+    return idx.astype(np.uint8).reshape(shape)
+
+
+class GoldenFrameStore:
+    """
+    Content addressed on disk store of golden frames
+
+    Frames are packed 6 bit indices, deflated, one file per key. Least recently used files are evicted once the
+    store grows past max_bytes. Files are replaced atomically so workers can share the store
+    """
+    def __init__(self, path: str = GOLDEN_STORE_PATH, max_bytes: int = GOLDEN_STORE_MB << 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return "GoldenFrameStore(path={}, hits={}, misses={})".format(self.path, self.hits, self.misses)
+
+    @staticmethod
+    def key(scene) -> str:
+        """
+        Store key of a scene, or of any other hashable description of a frame
+        """
+        return hashlib.sha256((MODEL_VERSION + repr(tuple(scene))).encode()).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + '.npz')
+
+    def get(self, key: str) -> np.ndarray:
+        """
+        Stored frame for key, None when absent
+        """
+        try:
+            with np.load(self._file(key)) as data:
+                frame = unpack_indices(data['packed'], tuple(data['shape']))
+            os.utime(self._file(key))
+        except (OSError, KeyError, ValueError):
+            # Missing, evicted underneath us or unreadable
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return frame
+
+    def put(self, key: str, frame: np.ndarray):
+        """
+        Store a frame of 6 bit color indices under key
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, packed=pack_indices(frame), shape=np.array(frame.shape))
+            os.replace(tmp, self._file(key))
+        except BaseException:
+            # Never leave a partial frame behind
+            os.unlink(tmp)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used frames until the store fits in max_bytes
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.npz'):
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Remove all stored frames and reset counters
+        """
+        for name in os.listdir(self.path):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.path, name))
+        self.hits = 0
+        self.misses = 0
+
+
+def render_scene_to_store(scene: Scene, store: GoldenFrameStore) -> np.ndarray:
+    """
+    Render a scene and persist the frame, runs in the worker so compression stays off the simulator
+    """
+    frame = render_scene(scene)
+    store.put(store.key(scene), frame)
+    return frame
+
+
+class GoldenFrameService:
+    """
+    Hands scenes to a process pool and returns futures of their ground truth frames
+
+    Scenes already held by the store resolve immediately without rendering
+    """
+    def __init__(self, max_workers: int = None, store: GoldenFrameStore = None):
+        if max_workers is None:
+            max_workers = int(os.environ.get('GOLDEN_WORKERS') or os.cpu_count() or 1)
+        if store is None:
+            store_mb = int(os.environ.get('GOLDEN_STORE_MB') or GOLDEN_STORE_MB)
+            if store_mb > 0:
+                store = GoldenFrameStore(path=os.environ.get('GOLDEN_STORE') or GOLDEN_STORE_PATH, max_bytes=store_mb << 20)
+
+        # Spawned and forkserver workers start sys.executable, which is the simulator itself when Python is embedded in
+        # it, so render inline where fork is not available
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            max_workers = 0
+
+        self.max_workers = max_workers
+        self.store = store
+        self._executor = None
+
+        if max_workers > 0:
+            # Workers are forked from the simulator process. They only render with numpy and never touch the GPI, and
+            # multiprocessing ends them with os._exit, so the simulator's exit handlers never run in a worker
+            self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork'))
+
+    def submit(self, scene: Scene) -> Future:
+        """
+        Start rendering a scene, the returned future resolves to its frame of color indices
+        """
+        if self.store is not None:
+            frame = self.store.get(self.store.key(scene))
+            if frame is not None:
+                future = Future()
+                future.set_result(frame)
+                return future
+
+        if self._executor is not None:
+            if self.store is not None:
+                return self._executor.submit(render_scene_to_store, scene, self.store)
+            return self._executor.submit(render_scene, scene)
+
+        # Inline mode, render now and hand back a resolved future
+        future = Future()
+        if self.store is not None:
+            future.set_result(render_scene_to_store(scene, self.store))
+        else:
+            future.set_result(render_scene(scene))
+        return future
+
+    def shutdown(self):
+        """
+        Stop all workers, scenes not yet started are dropped
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+# Created on first use and shared by every test in the simulator process
+_service = None
+
+
+def golden_service() -> GoldenFrameService:
+    """
+    Shared golden frame service
+    """
+    global _service
+    if _service is None:
+        _service = GoldenFrameService()
+
+        # Join the workers when the simulator finalizes Python rather than leaving them to interpreter teardown
+        atexit.register(_service.shutdown)
+    return _service
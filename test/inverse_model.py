@@ -0,0 +1,146 @@
+"""
+Bit exact model of the inverse determinant approximation
+
+Evaluates tt_um_emern_inverse over its whole 13 bit input domain at once and summarizes the approximation error
+per octave of the input. Run as a script to regenerate the persisted error table:
+
+    python inverse_model.py
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import numpy as np
+from fixed_point import to_signed
+
+# Port widths, see inverse.v
+DET_BITS = 13
+DET_POS_BITS = 12
+INV_DET_BITS = 23
+
+# Internal fixed point widths, signed Q3.23 and Q26.23 products
+FRAC_BITS = 23
+Q3_BITS = 27
+PRODUCT_BITS = 50
+INV_DET_FULL_BITS = 39
+
+# Magic numbers in signed Q3.23
+MAGIC_B = 0x0BBA5E3
+MAGIC_D = 0x0802752
+
+# Output slice inv_det_full[0:-23] lands in bits [34:12] once truncated to the port
+INV_DET_SHIFT = 12
+
+# Persisted per octave error summary
+ERROR_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inverse_error_table.json')
+
+
+def leading_zeros(det_pos: np.ndarray) -> np.ndarray:
+    """
+    Leading zero count of the 12 bit positive determinant, 12 for zero
+    """
+    det_pos = np.asarray(det_pos, dtype=np.int64)
+    lzc = np.full(det_pos.shape, DET_POS_BITS, dtype=np.int64)
+
+    # Highest set bit wins, so walk from the LSB up
+    for bit in range(DET_POS_BITS):
+        lzc = np.where((det_pos >> bit) & 1 == 1, DET_POS_BITS - 1 - bit, lzc)
+
+    return lzc
+
+
+def inverse_hw(determinant) -> tuple:
+    """
+    Bit exact model of tt_um_emern_inverse
+
+    determinant is any array of signed values or raw 13 bit patterns
+    Returns (inv_det, inv_det_negative) as the integers driven on the output ports
+    """
+    determinant = np.asarray(determinant, dtype=np.int64) & ((1 << DET_BITS) - 1)
+
+    # Make the determinant strictly positive
+    negative = (determinant >> (DET_BITS - 1)) & 1
+    det_negative = (-determinant) & ((1 << DET_BITS) - 1)
+    det_pos = np.where(negative == 0, determinant, det_negative) & ((1 << DET_POS_BITS) - 1)
+
+    lzc = leading_zeros(det_pos)
+
+    # Scale to [0.5, 1] in Q3.23
+    a = to_signed(((det_pos << FRAC_BITS) >> (DET_POS_BITS - lzc)) & ((1 << Q3_BITS) - 1), Q3_BITS)
+    b = to_signed(MAGIC_B - a, Q3_BITS)
+    c = to_signed(a * b, PRODUCT_BITS)
+    d = to_signed(MAGIC_D - to_signed((c >> FRAC_BITS) & ((1 << Q3_BITS) - 1), Q3_BITS), Q3_BITS)
+    e = to_signed(d * b, PRODUCT_BITS)
+    f = to_signed((((e >> FRAC_BITS) & ((1 << Q3_BITS) - 1)) << 2) & ((1 << Q3_BITS) - 1), Q3_BITS)
+
+    # Rescale by lzc and slice out the fractional part
+    inv_det_full = (f << lzc) & ((1 << INV_DET_FULL_BITS) - 1)
+    inv_det = (inv_det_full >> INV_DET_SHIFT) & ((1 << INV_DET_BITS) - 1)
+
+    return inv_det, negative
+
+
+def inverse_lut() -> tuple:
+    """
+    Exhaustive lookup table of the module, indexed by the raw 13 bit determinant pattern
+    """
+    return inverse_hw(np.arange(1 << DET_BITS, dtype=np.int64))
+
+
+def error_table() -> list:
+    """
+    Relative error of the approximation against 1/|det| for every octave of |det|
+
+    Octave k holds 2^k <= |det| < 2^(k+1), det == 0 has no inverse and is skipped
+    """
+    det_pos = np.arange(1, 1 << DET_POS_BITS, dtype=np.int64)
+    inv_det, _ = inverse_hw(det_pos)
+
+    rel_error = np.abs(inv_det / float(1 << FRAC_BITS) * det_pos - 1.)
+    octave = np.floor(np.log2(det_pos)).astype(np.int64)
+
+    table = []
+    for k in range(DET_POS_BITS):
+        sel = rel_error[octave == k]
+        table.append({'octave': k,
+                      'det_min': 1 << k,
+                      'det_max': (1 << (k + 1)) - 1,
+                      'max_rel_error': float(sel.max()),
+                      'mean_rel_error': float(sel.mean())})
+
+    return table
+
+
+def save_error_table(path: str = ERROR_TABLE_PATH):
+    """
+    Persist the per octave error table as JSON
+    """
+    with open(path, 'w') as f:
+        json.dump(error_table(), f, indent=2)
+        f.write('\n')
+
+
+def load_error_table(path: str = ERROR_TABLE_PATH) -> list:
+    """
+    Load the persisted per octave error table
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def max_relative_error(det: int, table: list = None) -> float:
+    """
+    Worst case relative error of the approximation for the octave holding |det|
+    """
+    if table is None:
+        table = load_error_table()
+
+    return table[abs(int(det)).bit_length() - 1]['max_rel_error']
+
+
+if __name__ == '__main__':
+    save_error_table()
+    for row in load_error_table():
+        print("{octave:2d} [{det_min:4d}, {det_max:4d}] max {max_rel_error:.5f} mean {mean_rel_error:.5f}".format(**row))
@@ -0,0 +1,59 @@
+"""
+Merge cocotb results files
+
+Suites run concurrently each write their own results file, this combines them into a single report and fails if any
+test failed or a results file is missing:
+
+    python merge_results.py results_all.xml results.xml results_pixel_core.xml ...
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+
+def merge(paths: list) -> ET.Element:
+    """
+    Single testsuites element holding the test suites of every results file, each renamed after its file
+    """
+    merged = ET.Element('testsuites', name='results')
+    for path in paths:
+        suite_name = os.path.splitext(os.path.basename(path))[0]
+        for suite in ET.parse(path).getroot().iter('testsuite'):
+            suite.set('name', suite_name)
+            merged.append(suite)
+    return merged
+
+
+def count_failures(results: ET.Element) -> tuple:
+    """
+    Number of test cases and failed test cases in a results tree
+    """
+    n_tests = 0
+    n_failed = 0
+    for case in results.iter('testcase'):
+        n_tests += 1
+        if case.find('failure') is not None or case.find('error') is not None:
+            n_failed += 1
+    return n_tests, n_failed
+
+
+def main(output_path: str, paths: list) -> int:
+    missing = [path for path in paths if not os.path.exists(path)]
+    for path in missing:
+        print("No results file " + path)
+
+    merged = merge([path for path in paths if path not in missing])
+    ET.ElementTree(merged).write(output_path, encoding='UTF-8', xml_declaration=True)
+
+    n_tests, n_failed = count_failures(merged)
+    print("{}: {} suites, {} tests, {} failed".format(output_path, len(paths) - len(missing), n_tests, n_failed))
+
+    return 1 if n_failed > 0 or len(missing) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1], sys.argv[2:]))
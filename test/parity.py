@@ -0,0 +1,86 @@
+"""
+Simulator parity check
+
+Compares cocotb results of the same suites run under Icarus Verilog and Verilator. Every test has to be present in
+both runs with the same outcome. Results are expected as <dir>/icarus_<suite>.xml and <dir>/verilator_<suite>.xml,
+as written by make parity:
+
+    python parity.py parity
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import glob
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+SIMULATORS = ('icarus', 'verilator')
+
+
+def load_results(path: str) -> dict:
+    """
+    Outcome of every test case in a cocotb results file, keyed by (module, test)
+    """
+    results = {}
+    for case in ET.parse(path).getroot().iter('testcase'):
+        if case.find('failure') is not None or case.find('error') is not None:
+            outcome = 'failed'
+        elif case.find('skipped') is not None:
+            outcome = 'skipped'
+        else:
+            outcome = 'passed'
+        results[(case.get('classname'), case.get('name'))] = outcome
+    return results
+
+
+def compare(reference: dict, other: dict) -> list:
+    """
+    Describe every test whose outcome differs between two runs
+    """
+    mismatches = []
+    for key in sorted(set(reference) | set(other)):
+        outcome_ref = reference.get(key, 'missing')
+        outcome_other = other.get(key, 'missing')
+        if outcome_ref != outcome_other:
+            mismatches.append("{}.{}: {} {}, {} {}".format(key[0], key[1], SIMULATORS[0], outcome_ref,
+                                                          SIMULATORS[1], outcome_other))
+    return mismatches
+
+
+def main(results_dir: str) -> int:
+    failed = False
+
+    # Suites with results from either simulator, one that failed to build has none
+    suites = set()
+    for simulator in SIMULATORS:
+        for path in glob.glob(os.path.join(results_dir, simulator + '_*.xml')):
+            suites.add(os.path.basename(path)[len(simulator) + 1:-len('.xml')])
+    if len(suites) == 0:
+        print("No results found in " + results_dir)
+        return 1
+
+    for suite in sorted(suites):
+        reference_path = os.path.join(results_dir, SIMULATORS[0] + '_' + suite + '.xml')
+        other_path = os.path.join(results_dir, SIMULATORS[1] + '_' + suite + '.xml')
+
+        missing = [simulator for simulator, path in zip(SIMULATORS, (reference_path, other_path))
+                   if not os.path.exists(path)]
+        if len(missing) > 0:
+            print(suite + ": no " + " or ".join(missing) + " results")
+            failed = True
+            continue
+
+        reference = load_results(reference_path)
+        mismatches = compare(reference, load_results(other_path))
+        print("{}: {} tests, {} mismatches".format(suite, len(reference), len(mismatches)))
+        for mismatch in mismatches:
+            print("  " + mismatch)
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else 'parity'))
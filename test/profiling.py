@@ -0,0 +1,150 @@
+"""
+Opt-in per test profiling
+
+With PROFILE_TESTS=1 every cocotb test of a module that calls profile_tests(globals()) runs under a deterministic
+stack profiler. Time is split between the simulator (no Python running), GPI signal access (cocotb handles and the
+simulator module), the reference model and the rest of the Python harness. Each test logs the split and saves it next
+to the results file as <results>_profile/<test>.json, with its stacks in collapsed form as <test>.folded for
+flamegraph.pl or speedscope
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import functools
+import json
+import os
+import sys
+import time
+import cocotb
+
+PROFILE_TESTS = os.environ.get('PROFILE_TESTS', '0') == '1'
+
+# Stack labels are <module>.<function>, these prefixes decide the category of a stack
+GPI_PREFIXES = ('cocotb.handle.', 'cocotb.simulator.')
+MODEL_PREFIXES = ('raster_model.', 'ray_tracer_model.', 'inverse_model.', 'fixed_point.', 'golden.', 'frame_capture.')
+
+SIMULATOR_LABEL = '[simulator]'
+CATEGORIES = ('simulator', 'gpi', 'model', 'python')
+
+
+def frame_label(frame) -> str:
+    return frame.f_globals.get('__name__', '?') + '.' + frame.f_code.co_name
+
+
+def builtin_label(func) -> str:
+    owner = getattr(func, '__self__', None)
+    module = getattr(func, '__module__', None) or type(owner).__module__
+    return str(module) + '.' + getattr(func, '__qualname__', repr(func))
+
+
+def stack_category(stack: tuple) -> str:
+    """
+    Category of a stack, decided by its outermost GPI or reference model frame
+    """
+    if stack == (SIMULATOR_LABEL,):
+        return 'simulator'
+    for label in stack:
+        if label.startswith(GPI_PREFIXES):
+            return 'gpi'
+        if label.startswith(MODEL_PREFIXES):
+            return 'model'
+    return 'python'
+
+
+class StackProfiler:
+    """
+    Self time of every Python call stack seen while enabled, time with no Python running goes to the simulator
+    """
+    def __init__(self):
+        self.self_time = {}
+        self._keys = []
+        self._last = None
+
+    def _event(self, frame, event, arg):
+        now = time.perf_counter()
+
+        key = self._keys[-1] if len(self._keys) > 0 else (SIMULATOR_LABEL,)
+        self.self_time[key] = self.self_time.get(key, 0.0) + now - self._last
+
+        if event == 'call' or event == 'c_call':
+            label = frame_label(frame) if event == 'call' else builtin_label(arg)
+            parent = self._keys[-1] if len(self._keys) > 0 else ()
+            self._keys.append(parent + (label,))
+        elif len(self._keys) > 0:
+            # Returns of frames entered before the profiler was enabled have nothing to pop
+            self._keys.pop()
+
+        self._last = time.perf_counter()
+
+    def enable(self):
+        self._keys = []
+        self._last = time.perf_counter()
+        sys.setprofile(self._event)
+
+    def disable(self):
+        sys.setprofile(None)
+
+    def categories(self) -> dict:
+        """
+        Seconds spent in each category
+        """
+        totals = dict.fromkeys(CATEGORIES, 0.0)
+        for stack, seconds in self.self_time.items():
+            totals[stack_category(stack)] += seconds
+        return totals
+
+    def write_folded(self, path: str):
+        """
+        Collapsed stacks weighted in microseconds
+        """
+        with open(path, 'w') as f:
+            for stack, seconds in sorted(self.self_time.items()):
+                us = int(seconds * 1e6)
+                if us > 0:
+                    f.write(';'.join(stack) + ' ' + str(us) + '\n')
+
+
+def profile_dir() -> str:
+    results = os.environ.get('COCOTB_RESULTS_FILE', 'results.xml')
+    return os.path.splitext(results)[0] + '_profile'
+
+
+def profiled(func):
+    """
+    Wrap a test coroutine function so it runs under the stack profiler
+    """
+    @functools.wraps(func)
+    async def wrapper(dut, *args, **kwargs):
+        profiler = StackProfiler()
+        wall_start = time.perf_counter()
+        profiler.enable()
+        try:
+            return await func(dut, *args, **kwargs)
+        finally:
+            profiler.disable()
+            wall = time.perf_counter() - wall_start
+
+            totals = profiler.categories()
+            dut._log.info("Profile " + ", ".join("{} {:.2f}s ({:.0%})".format(name, seconds, seconds / wall)
+                                                  for name, seconds in totals.items()))
+
+            out_dir = profile_dir()
+            os.makedirs(out_dir, exist_ok=True)
+            with open(os.path.join(out_dir, func.__name__ + '.json'), 'w') as f:
+                json.dump(dict(totals, wall=wall), f, indent=2)
+            profiler.write_folded(os.path.join(out_dir, func.__name__ + '.folded'))
+
+    return wrapper
+
+
+def profile_tests(namespace: dict):
+    """
+    Profile every cocotb test in a test module namespace when PROFILE_TESTS=1
+    """
+    if not PROFILE_TESTS:
+        return
+
+    for obj in namespace.values():
+        if isinstance(obj, cocotb.test):
+            obj._func = profiled(obj._func)
@@ -0,0 +1,336 @@
+"""
+Frame level reference model for the rasterization pipeline
+
+Evaluates the same edge functions as should_pixel_be_rasterized but for every pixel of a frame at once
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+from collections import OrderedDict
+from fixed_point import to_signed
+
+# Visible VGA region
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+
+# Hardware widths, see constants.v and raster_core.v
+WPX = 7
+WPY = 6
+PIXEL_COL_BITS = 10
+PIXEL_ROW_BITS = 9
+EDGE_X_BITS = 11
+EDGE_Y_BITS = 10
+RES_BITS = 23
+
+# Vertices are stored compressed by / 8
+VERTEX_SHIFT = 3
+
+# Color widths, colors are packed as rrggbb
+WCOLOR = 6
+COLOR_LEVELS = 4
+
+# 6 bit color index -> 8 bit RGB, same scaling as upscale_color
+PALETTE = np.array([[((c >> 4) & 3) * 64, ((c >> 2) & 3) * 64, (c & 3) * 64] for c in range(1 << WCOLOR)], dtype=np.uint8)
+
+# Default number of packed masks held by the coverage cache, roughly 38KB each
+COVERAGE_CACHE_SIZE = 256
+
+
+def as_vertices(v) -> np.ndarray:
+    """
+    Convert a single [x, y] vertex or a stack of (N, 2) vertices into an array usable by the frame models
+
+    Integer inputs are widened to int64 so edge products can never overflow, float inputs are kept as float
+    """
+    v = np.asarray(v)
+    return v.astype(np.result_type(v.dtype, np.int64), copy=False)
+
+
+def edge_function(va: np.ndarray, vb: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """
+    Evaluate the edge function from va -> vb over a grid of pixel rows and columns
+
+    Vertex batch dimensions lead, grid dimensions trail
+    """
+    # Trailing axes for the pixel grid
+    ax = (vb[..., 0] - va[..., 0])[..., None, None]
+    ay = (vb[..., 1] - va[..., 1])[..., None, None]
+    ox = va[..., 0][..., None, None]
+    oy = va[..., 1][..., None, None]
+
+    return ax * (rows - oy) - ay * (cols - ox)
+
+
+def bounding_window(v0, v1, v2, width: int = FRAME_WIDTH, height: int = FRAME_HEIGHT) -> tuple:
+    """
+    Pixel window (row_start, row_stop, col_start, col_stop) holding every pixel a single triangle can cover
+
+    Degenerate (zero area) triangles pass the edge test along whole lines of the screen, so they get the full frame
+    """
+    v = np.stack([as_vertices(v0), as_vertices(v1), as_vertices(v2)])
+
+    area = (v[1, 0] - v[0, 0]) * (v[2, 1] - v[0, 1]) - (v[1, 1] - v[0, 1]) * (v[2, 0] - v[0, 0])
+    if area == 0:
+        return (0, height, 0, width)
+
+    # Clip to the frame, an off screen triangle gives an empty window
+    row_start = min(max(int(np.ceil(v[:, 1].min())), 0), height)
+    row_stop = max(min(int(np.floor(v[:, 1].max())) + 1, height), row_start)
+    col_start = min(max(int(np.ceil(v[:, 0].min())), 0), width)
+    col_stop = max(min(int(np.floor(v[:, 0].max())) + 1, width), col_start)
+
+    return (row_start, row_stop, col_start, col_stop)
+
+
+def window_coverage(edge, v0: np.ndarray, v1: np.ndarray, v2: np.ndarray, window: tuple,
+                    row_mask: int = -1, col_mask: int = -1) -> np.ndarray:
+    """
+    Evaluate a triangle with the given edge function only inside window, returns the mask of that window
+    """
+    row_start, row_stop, col_start, col_stop = window
+
+    rows = np.arange(row_start, row_stop, dtype=np.int64)[:, None] & row_mask
+    cols = np.arange(col_start, col_stop, dtype=np.int64)[None, :] & col_mask
+
+    # Pixel is rasterized only if all three normals are positive
+    mask = edge(v0, v1, rows, cols) >= 0
+    mask &= edge(v1, v2, rows, cols) >= 0
+    mask &= edge(v2, v0, rows, cols) >= 0
+
+    return mask
+
+
+def rasterize_frame(v0, v1, v2, width: int = FRAME_WIDTH, height: int = FRAME_HEIGHT, out: np.ndarray = None) -> np.ndarray:
+    """
+    Vectorized should_pixel_be_rasterized over a whole frame
+
+    Vertices are either single [x, y] pairs or stacked (N, 2) batches
+    Returns a boolean (height, width) coverage mask, or (N, height, width) for a batch, written into out if given
+    Each triangle is only evaluated over its bounding window
+    """
+    v0 = as_vertices(v0)
+    v1 = as_vertices(v1)
+    v2 = as_vertices(v2)
+
+    if out is None:
+        out = np.zeros(v0.shape[:-1] + (height, width), dtype=bool)
+
+    # Batches are culled triangle by triangle
+    if v0.ndim > 1:
+        for n in range(v0.shape[0]):
+            rasterize_frame(v0[n], v1[n], v2[n], width=width, height=height, out=out[n])
+        return out
+
+    window = bounding_window(v0, v1, v2, width, height)
+    row_start, row_stop, col_start, col_stop = window
+
+    out[...] = False
+    out[row_start:row_stop, col_start:col_stop] = window_coverage(edge_function, v0, v1, v2, window)
+
+    return out
+
+
+def quantize_vertex(v) -> np.ndarray:
+    """
+    Compress pixel space vertices into the [x, y] register fields seen by the hardware
+    """
+    v = as_vertices(v)
+    x = (v[..., 0] >> VERTEX_SHIFT) & ((1 << WPX) - 1)
+    y = (v[..., 1] >> VERTEX_SHIFT) & ((1 << WPY) - 1)
+    return np.stack([x, y], axis=-1)
+
+
+def hw_edge_function(va: np.ndarray, vb: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """
+    Bit exact res_a/res_b/res_c computation of tt_um_emern_raster_core for the edge va -> vb
+    """
+    # Vertex deltas are computed on the compressed fields then expanded
+    e_x = to_signed((vb[..., 0] - va[..., 0]) << VERTEX_SHIFT, EDGE_X_BITS)[..., None, None]
+    e_y = to_signed((vb[..., 1] - va[..., 1]) << VERTEX_SHIFT, EDGE_Y_BITS)[..., None, None]
+
+    # Expanded base vertex
+    ox = ((va[..., 0] << VERTEX_SHIFT) & ((1 << PIXEL_COL_BITS) - 1))[..., None, None]
+    oy = ((va[..., 1] << VERTEX_SHIFT) & ((1 << PIXEL_ROW_BITS) - 1))[..., None, None]
+
+    return to_signed(e_x * (rows - oy) - e_y * (cols - ox), RES_BITS)
+
+
+def rasterize_frame_hw(v0, v1, v2, width: int = FRAME_WIDTH, height: int = FRAME_HEIGHT, out: np.ndarray = None) -> np.ndarray:
+    """
+    Bit exact model of tt_um_emern_raster_core over a whole frame
+
+    Vertices are the compressed [x, y] register fields (see quantize_vertex), single or stacked (N, 2)
+    Returns a boolean (height, width) mask, or (N, height, width) for a batch, written into out if given
+
+    At the port widths res_a/res_b/res_c can never wrap for on screen pixels, so the hardware agrees with the
+    ideal edge test on the expanded vertices and the same bounding window culling is exact
+    """
+    v0 = as_vertices(v0)
+    v1 = as_vertices(v1)
+    v2 = as_vertices(v2)
+
+    if out is None:
+        out = np.zeros(v0.shape[:-1] + (height, width), dtype=bool)
+
+    # Batches are culled triangle by triangle
+    if v0.ndim > 1:
+        for n in range(v0.shape[0]):
+            rasterize_frame_hw(v0[n], v1[n], v2[n], width=width, height=height, out=out[n])
+        return out
+
+    # Truncate inputs to the port widths
+    fields = np.array([(1 << WPX) - 1, (1 << WPY) - 1])
+    v0 = v0 & fields
+    v1 = v1 & fields
+    v2 = v2 & fields
+
+    window = bounding_window(v0 << VERTEX_SHIFT, v1 << VERTEX_SHIFT, v2 << VERTEX_SHIFT, width, height)
+    row_start, row_stop, col_start, col_stop = window
+
+    # Only the sign bit of each result is tested
+    out[...] = False
+    out[row_start:row_stop, col_start:col_stop] = window_coverage(hw_edge_function, v0, v1, v2, window,
+                                                                 row_mask=(1 << PIXEL_ROW_BITS) - 1,
+                                                                 col_mask=(1 << PIXEL_COL_BITS) - 1)
+
+    return out
+
+
+class CoverageCache:
+    """
+    Bounded LRU cache of packed-bit coverage masks
+
+    Keyed by the compressed (v0, v1, v2) register fields, so every triangle the hardware can hold maps to one entry
+    """
+    def __init__(self, max_entries: int = COVERAGE_CACHE_SIZE, width: int = FRAME_WIDTH, height: int = FRAME_HEIGHT):
+        self.max_entries = max_entries
+        self.width = width
+        self.height = height
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return "CoverageCache(entries={}, hits={}, misses={})".format(len(self), self.hits, self.misses)
+
+    @staticmethod
+    def key(v0, v1, v2) -> tuple:
+        """
+        Cache key for a triangle given by its compressed register fields
+
+        Fields are truncated to the port widths as in rasterize_frame_hw, so aliasing vertices share an entry
+        """
+        fields = ((1 << WPX) - 1, (1 << WPY) - 1)
+        return tuple(int(c) & mask for v in (v0, v1, v2) for c, mask in zip(as_vertices(v), fields))
+
+    def get(self, v0, v1, v2) -> np.ndarray:
+        """
+        Get the boolean coverage mask of a triangle given by its compressed register fields
+        """
+        key = self.key(v0, v1, v2)
+
+        packed = self._entries.get(key)
+        if packed is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            mask = rasterize_frame_hw(v0, v1, v2, width=self.width, height=self.height)
+            packed = np.packbits(mask, axis=-1)
+            self._entries[key] = packed
+
+            # Evict least recently used
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return np.unpackbits(packed, axis=-1, count=self.width).astype(bool)
+
+    def clear(self):
+        """
+        Drop all entries and reset counters
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Shared between all tests running in the same simulator process
+COVERAGE_CACHE = CoverageCache()
+
+
+def cached_coverage(v0, v1, v2) -> np.ndarray:
+    """
+    Coverage mask of a pixel space triangle as drawn by the hardware, served from the shared cache
+    """
+    return COVERAGE_CACHE.get(quantize_vertex(v0), quantize_vertex(v1), quantize_vertex(v2))
+
+
+def composite_frame(masks: np.ndarray, colors, enables, background_color: int, out: np.ndarray = None) -> np.ndarray:
+    """
+    Composite K stacked coverage masks into a frame of 6 bit color indices, written into out if given
+
+    Slot 0 has the highest priority, matching the casez in tt_um_emern_pixel_core
+    masks is (K, height, width), colors and enables are length K
+    """
+    masks = np.asarray(masks, dtype=bool)
+    colors = np.asarray(colors, dtype=np.uint8)
+    enables = np.asarray(enables, dtype=bool)
+
+    # Gate each slot by its enable
+    gated = masks & enables[:, None, None]
+
+    # First requesting slot along the slot axis wins
+    winner = np.argmax(gated, axis=0)
+    covered = np.any(gated, axis=0)
+
+    if out is None:
+        out = np.empty(masks.shape[1:], dtype=np.uint8)
+
+    out[...] = background_color
+    np.copyto(out, colors[winner], where=covered)
+
+    return out
+
+
+def render_frame(v0, v1, v2, colors, enables, background_color: int, out: np.ndarray = None,
+                 width: int = FRAME_WIDTH, height: int = FRAME_HEIGHT) -> np.ndarray:
+    """
+    Render polygon slots straight into a frame of 6 bit color indices, written into out if given
+
+    Vertices are (K, 2) stacks of compressed register fields, slot 0 has the highest priority
+    Each triangle only touches its bounding window, so the cost follows the covered area rather than K * frame size
+    """
+    v0 = as_vertices(v0) & np.array([(1 << WPX) - 1, (1 << WPY) - 1])
+    v1 = as_vertices(v1) & np.array([(1 << WPX) - 1, (1 << WPY) - 1])
+    v2 = as_vertices(v2) & np.array([(1 << WPX) - 1, (1 << WPY) - 1])
+
+    if out is None:
+        out = np.empty((height, width), dtype=np.uint8)
+
+    out[...] = background_color
+
+    # Paint lowest priority first so slot 0 ends up in front
+    for slot in reversed(range(len(v0))):
+        if not enables[slot]:
+            continue
+
+        window = bounding_window(v0[slot] << VERTEX_SHIFT, v1[slot] << VERTEX_SHIFT, v2[slot] << VERTEX_SHIFT, width, height)
+        row_start, row_stop, col_start, col_stop = window
+
+        mask = window_coverage(hw_edge_function, v0[slot], v1[slot], v2[slot], window,
+                               row_mask=(1 << PIXEL_ROW_BITS) - 1, col_mask=(1 << PIXEL_COL_BITS) - 1)
+        out[row_start:row_stop, col_start:col_stop][mask] = colors[slot]
+
+    return out
+
+
+def frame_to_rgb(frame: np.ndarray) -> np.ndarray:
+    """
+    Expand a frame of 6 bit color indices into 8 bit RGB
+    """
+    return PALETTE[frame]
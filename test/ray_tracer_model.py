@@ -0,0 +1,194 @@
+"""
+Frame level reference model for the ray tracer core
+
+Moller Trumbore intersection for every pixel of a frame at once, as a float oracle and as a bit exact model of
+tt_um_emern_ray_tracer_core
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+from raster_model import FRAME_WIDTH, FRAME_HEIGHT
+from fixed_point import to_signed, encode
+from inverse_model import inverse_hw, max_relative_error, DET_POS_BITS
+
+# Fixed point format of the core, see ray_tracer_core.v
+QM = 23
+QF = 23
+
+# Hardware widths
+PIXEL_COL_BITS = 10
+PIXEL_ROW_BITS = 9
+EDGE_X_BITS = 11
+EDGE_Y_BITS = 10
+EDGE_Z_BITS = 4
+S_BITS = 11
+UNSCALED_T_BITS = QM + 1
+INV_DET_BITS = QM + QF
+Z_BITS = 3
+
+# Depth reported by the oracle when a ray misses the polygon
+NO_INTERSECTION_DEPTH = -7.
+
+
+def _split_vertices(v0, v1, v2) -> tuple:
+    """
+    Unpack [x, y, z] vertices into int64 components
+    """
+    v0 = np.asarray(v0, dtype=np.int64)
+    v1 = np.asarray(v1, dtype=np.int64)
+    v2 = np.asarray(v2, dtype=np.int64)
+    return v0, v1, v2
+
+
+def polygon_determinant(v0, v1, v2) -> int:
+    """
+    Determinant of the polygon as computed by the testbench
+    """
+    v0, v1, v2 = _split_vertices(v0, v1, v2)
+    return int((v1[0] - v0[0]) * (v2[1] - v0[1]) - (v1[1] - v0[1]) * (v2[0] - v0[0]))
+
+
+def inverse_determinant(det: int) -> int:
+    """
+    Unsigned Q23.23 encoding of 1/det as written by the testbench
+
+    Truncated, negative determinants saturate to 0 and a zero determinant has no inverse (0)
+    """
+    if det == 0:
+        return 0
+    return int(encode(1. / det, n_word=INV_DET_BITS, n_frac=QF, signed=False))
+
+
+def approx_inverse_determinant(det: int) -> int:
+    """
+    Q23.23 encoding of 1/det as computed by tt_um_emern_inverse, which only takes 0 < det < 2^12
+    """
+    assert 0 < det < (1 << DET_POS_BITS), "Determinant " + str(det) + " is outside the inverse module range"
+    inv_det, _ = inverse_hw(det)
+    return int(inv_det)
+
+
+def approx_depth_error(v0, v1, v2, table: list = None) -> float:
+    """
+    Bound on the depth error over the polygon when inv_det comes from tt_um_emern_inverse
+
+    The relative error of the inverse, taken from the persisted per octave error table, scales |t| before rounding
+    """
+    depth, hit = depth_frame(v0, v1, v2)
+    max_t = float(np.abs(depth[hit]).max()) + 0.5 if np.any(hit) else 0.
+    return max_t * max_relative_error(polygon_determinant(v0, v1, v2), table)
+
+
+def depth_frame(v0, v1, v2, width: int = FRAME_WIDTH, height: int = FRAME_HEIGHT) -> tuple:
+    """
+    Vectorized get_gt_depth over a whole frame
+
+    Returns the (height, width) depth map, NO_INTERSECTION_DEPTH where the ray misses, and the intersection mask
+    """
+    v0, v1, v2 = _split_vertices(v0, v1, v2)
+
+    # Rays start at every pixel and point along -z
+    px = np.arange(width, dtype=np.int64)[None, :]
+    py = np.arange(height, dtype=np.int64)[:, None]
+
+    # Edge 1 and 2 vectors
+    e1 = v1 - v0
+    e2 = v2 - v0
+
+    # Determinant and its inverse
+    a = e1[0] * e2[1] - e1[1] * e2[0]
+    f = 1. / a
+
+    # S = origin - V0
+    s_x = px - v0[0]
+    s_y = py - v0[1]
+    s_z = -v0[2]
+
+    # Barycentric coordinate u
+    u = s_x * e2[1] - s_y * e2[0]
+
+    # q = s X edge_1
+    q_x = s_y * e1[2] - s_z * e1[1]
+    q_y = s_z * e1[0] - s_x * e1[2]
+    q_z = s_x * e1[1] - s_y * e1[0]
+
+    # Barycentric coordinate v
+    v = -q_z
+
+    # Distance along the ray
+    t = f * (e2[0] * q_x + e2[1] * q_y + e2[2] * q_z)
+
+    hit = ~((u > a) | (u < 0) | ((u + v) > a) | (v > a) | (v < 0))
+    depth = np.where(hit, np.round(t), NO_INTERSECTION_DEPTH)
+
+    return depth, hit
+
+
+def depth_frame_hw(v0, v1, v2, determinant: int = None, inv_det: int = None,
+                   width: int = FRAME_WIDTH, height: int = FRAME_HEIGHT) -> tuple:
+    """
+    Bit exact model of tt_um_emern_ray_tracer_core behind tb_ray_tracer_core over a whole frame
+
+    determinant and inv_det default to what the testbench writes for this polygon
+    Returns the (height, width) z_actual values and the rasterize mask
+    """
+    v0, v1, v2 = _split_vertices(v0, v1, v2)
+
+    if determinant is None:
+        determinant = polygon_determinant(v0, v1, v2)
+    if inv_det is None:
+        inv_det = inverse_determinant(determinant)
+
+    # Ports are unsigned, the core reinterprets them
+    det_u = int(determinant) & ((1 << QM) - 1)
+    inv_det_s = int(to_signed(int(inv_det), INV_DET_BITS))
+
+    # Edges are formed in the testbench
+    e1_x = int(to_signed(v1[0] - v0[0], EDGE_X_BITS))
+    e1_y = int(to_signed(v1[1] - v0[1], EDGE_Y_BITS))
+    e1_z = int(to_signed(v1[2] - v0[2], EDGE_Z_BITS))
+    e2_x = int(to_signed(v2[0] - v0[0], EDGE_X_BITS))
+    e2_y = int(to_signed(v2[1] - v0[1], EDGE_Y_BITS))
+    e2_z = int(to_signed(v2[2] - v0[2], EDGE_Z_BITS))
+
+    px = np.arange(width, dtype=np.int64)[None, :] & ((1 << PIXEL_COL_BITS) - 1)
+    py = np.arange(height, dtype=np.int64)[:, None] & ((1 << PIXEL_ROW_BITS) - 1)
+
+    # S = origin - V0
+    s_x = to_signed(px - v0[0], S_BITS)
+    s_y = to_signed(py - v0[1], S_BITS)
+    s_z = int(to_signed(-v0[2], S_BITS))
+
+    # Barycentric coordinates and q, all QM bits wide
+    u = to_signed(s_x * e2_y + s_y * to_signed(-e2_x, EDGE_X_BITS), QM)
+    q_x = to_signed(s_y * e1_z - s_z * e1_y, QM)
+    q_y = to_signed(s_z * e1_x - s_x * e1_z, QM)
+    q_z = to_signed(s_x * e1_y - s_y * e1_x, QM)
+    v = to_signed(-q_z, QM)
+
+    unscaled_t = to_signed(e2_x * q_x + e2_y * q_y + e2_z * q_z, UNSCALED_T_BITS)
+
+    # t_exp = inv_det * (unscaled_t <<< QF) is 69 bits wide, but every bit used below lives in
+    # p = (inv_det * unscaled_t) mod 2^(QM+QF), which is computed in two halves to stay within int64
+    mask_p = (1 << (QM + QF)) - 1
+    inv_hi = inv_det_s >> QF
+    inv_lo = inv_det_s & ((1 << QF) - 1)
+    p = ((((inv_hi * unscaled_t) & ((1 << QM) - 1)) << QF) + inv_lo * unscaled_t) & mask_p
+
+    # Round up when t_exp is negative with a clear half bit
+    round_up = (((p >> (QF - 1)) & 1) == 0) & (((p >> (QM + QF - 1)) & 1) == 1)
+    t = (-(p - (round_up.astype(np.int64) << QF))) & mask_p
+
+    # z_actual is the low integer bits of t
+    z_actual = (t >> QF) & ((1 << Z_BITS) - 1)
+
+    # Sum and comparisons against the unsigned determinant port
+    bary_sum = to_signed(u + v, QM)
+    rasterize = (u >= 0) & (v >= 0) & \
+                ((bary_sum & ((1 << QM) - 1)) <= det_u) & \
+                ((u & ((1 << QM) - 1)) <= det_u) & \
+                ((v & ((1 << QM) - 1)) <= det_u)
+
+    return z_actual, rasterize
@@ -0,0 +1,163 @@
+"""
+Run the tests of one suite sharded across simulator processes
+
+    python shard.py <suite> [n_shards] [make args...]
+
+The tests of the suite's MODULE are split into n_shards groups (the core count by default) selected with cocotb's
+TESTCASE. The suite is built once, then the shards run concurrently on that build with their results, waveform and
+testbench files under shards/. Shards are balanced on the test times of the previous results file when there is one,
+and are reassembled into the suite's usual results file in module order, keeping the per test timings:
+
+    python shard.py 2 6 SAVE_IMGS=False
+"""
+
+# SPDX-FileCopyrightText: Emery Nagy
+# SPDX-License-Identifier: MIT
+
+import ast
+import os
+import re
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+from merge_results import count_failures
+
+SHARD_DIR = 'shards'
+
+
+def makefile_vars(path: str) -> dict:
+    """
+    Top level NAME = value assignments of a suite makefile
+    """
+    variables = {}
+    with open(path, 'r') as f:
+        for line in f:
+            m = re.match(r'^(\w+)\s*[?:]?=\s*(.*?)\s*$', line)
+            if m is not None:
+                variables[m.group(1)] = m.group(2)
+    return variables
+
+
+def list_tests(module_path: str) -> list:
+    """
+    Names of the cocotb tests of a test module in definition order, found without importing it
+    """
+    with open(module_path, 'r') as f:
+        tree = ast.parse(f.read())
+
+    tests = []
+    for node in tree.body:
+        if not isinstance(node, ast.AsyncFunctionDef):
+            continue
+        for decorator in node.decorator_list:
+            if isinstance(decorator, ast.Call):
+                decorator = decorator.func
+            if isinstance(decorator, ast.Attribute) and decorator.attr == 'test':
+                tests.append(node.name)
+                break
+    return tests
+
+
+def previous_times(results_path: str) -> dict:
+    """
+    Wall clock time of every test in an earlier results file, empty if there is none
+    """
+    if not os.path.exists(results_path):
+        return {}
+    return {case.get('name'): float(case.get('time', 0)) for case in ET.parse(results_path).getroot().iter('testcase')}
+
+
+def split_tests(tests: list, n_shards: int, times: dict = None) -> list:
+    """
+    Split tests into at most n_shards non empty groups
+
+    Longest tests are placed first, each on the least loaded shard. Tests without a known time count as the average
+    """
+    times = times or {}
+    known = [times[test] for test in tests if test in times]
+    default_time = sum(known) / len(known) if len(known) > 0 else 1.0
+
+    shards = [[] for _ in range(min(n_shards, len(tests)))]
+    loads = [0.0] * len(shards)
+    for test in sorted(tests, key=lambda test: -times.get(test, default_time)):
+        index = loads.index(min(loads))
+        shards[index].append(test)
+        loads[index] += times.get(test, default_time)
+
+    # Keep module order inside every shard
+    return [[test for test in tests if test in shard] for shard in shards]
+
+
+def shard_command(suite: str, index: int, tests: list, make_args: list) -> list:
+    """
+    make invocation running one shard of a suite
+    """
+    prefix = os.path.join(SHARD_DIR, '{}_{}'.format(suite, index))
+    plusargs = ['+dump_file=' + prefix + '.vcd',
+                '+sweep_file=' + prefix + '_sweep.hex',
+                '+capture_file=' + prefix + '_capture.bin',
+                '+spi_file=' + prefix + '_spi.hex']
+
+    return ['make', '-f', 'Makefile.' + suite] + make_args + \
+           ['TESTCASE=' + ','.join(tests),
+            'COCOTB_RESULTS_FILE=' + prefix + '.xml',
+            'PLUSARGS=' + ' '.join(plusargs)]
+
+
+def reassemble(tests: list, shard_paths: list) -> ET.Element:
+    """
+    Single results tree of a suite from its shard results files, test cases in module order
+    """
+    cases = {}
+    for path in shard_paths:
+        if os.path.exists(path):
+            for case in ET.parse(path).getroot().iter('testcase'):
+                cases[case.get('name')] = case
+
+    results = ET.Element('testsuites', name='results')
+    suite = ET.SubElement(results, 'testsuite', name='all', package='all')
+    for test in tests:
+        if test in cases:
+            suite.append(cases[test])
+        else:
+            # A shard that died takes its tests with it, report them rather than dropping them
+            case = ET.SubElement(suite, 'testcase', name=test, time='0')
+            ET.SubElement(case, 'error', message='Shard produced no result')
+    return results
+
+
+def main(suite: str, n_shards: int, make_args: list) -> int:
+    variables = makefile_vars('Makefile.' + suite)
+    results_path = variables.get('COCOTB_RESULTS_FILE', 'results.xml')
+    tests = list_tests(variables['MODULE'] + '.py')
+
+    shards = split_tests(tests, n_shards, previous_times(results_path))
+    os.makedirs(SHARD_DIR, exist_ok=True)
+
+    # Shards share the content hashed build, compile it before they start
+    if subprocess.run(['make', '-f', 'Makefile.' + suite] + make_args + ['build']).returncode != 0:
+        return 1
+
+    procs = []
+    for index, shard in enumerate(shards):
+        print("Shard {}: {}".format(index, ', '.join(shard)))
+        log = open(os.path.join(SHARD_DIR, '{}_{}.log'.format(suite, index)), 'w')
+        procs.append((subprocess.Popen(shard_command(suite, index, shard, make_args), stdout=log,
+                                       stderr=subprocess.STDOUT), log))
+
+    for proc, log in procs:
+        proc.wait()
+        log.close()
+
+    results = reassemble(tests, [os.path.join(SHARD_DIR, '{}_{}.xml'.format(suite, index))
+                                 for index in range(len(shards))])
+    ET.ElementTree(results).write(results_path, encoding='UTF-8', xml_declaration=True)
+
+    n_tests, n_failed = count_failures(results)
+    print("{}: {} shards, {} tests, {} failed".format(results_path, len(shards), n_tests, n_failed))
+
+    return 1 if n_failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1, sys.argv[3:]))
@@ -3,12 +3,19 @@ Shared utilities among tests
 """
 
 
-from cocotb.triggers import ClockCycles, Timer
+import cocotb
+from cocotb.triggers import ClockCycles, Timer, RisingEdge
 import random
 import numpy as np
+from collections import namedtuple
+from command_stream import SPI_CMD_BYTES, make_cmds, cmds_to_memh, is_wire, wire_to_memh
+from raster_model import cached_coverage, composite_frame, FRAME_WIDTH, FRAME_HEIGHT, WPX, WPY, WCOLOR
 
 SPI_CMD_TOTAL_BITS = 56
 
+# Commands held by the SPI master BFM of a testbench, see spi_master_bfm.v
+SPI_BFM_DEPTH = 4096
+
 # Valid SPI commands
 SPI_CMD_WRITE_POLY_A = 0x80
 SPI_CMD_CLEAR_POLY_A = 0x40
@@ -20,6 +27,9 @@ SPI_CMD_WRITE_POLY_D = 0x83
 SPI_CMD_CLEAR_POLY_D = 0x43
 SPI_CMD_SET_BG_COLOR = 0x01
 
+# Polygon slots held by the hardware, see constants.v
+N_POLY = 4
+
 # Colors mapping
 COLOR_BLACK = 0 # 000000
 COLOR_RED = 48 # 110000
@@ -37,9 +47,23 @@ class Polygon:
         self.v2 = v2
         self.raw_color = color
 
+        # Polygons are rasterized unless disabled
+        self.enable = True
+
         # Save as array for gt
         self.color = upscale_color(color)
 
+        # Lazily fetched full frame coverage mask
+        self._coverage = None
+
+    def coverage(self) -> np.ndarray:
+        """
+        Full frame boolean coverage mask of this polygon, as drawn from the compressed vertices the hardware stores
+        """
+        if self._coverage is None:
+            self._coverage = cached_coverage(self.v0, self.v1, self.v2)
+        return self._coverage
+
 
 class SPIcmd:
     """
@@ -69,7 +93,32 @@ class SPIcmd:
         """
         Encode the CMD as a 7 byte packed buffer
         """
-        return self.cmd_str.to_bytes(length=7, byteorder='little').hex()
+        return self.cmd_str.to_bytes(length=SPI_CMD_BYTES, byteorder='little')
+
+    @staticmethod
+    def to_records(cmds: list) -> np.ndarray:
+        """
+        Structured array of a list of commands, see command_stream
+        """
+        records = make_cmds(len(cmds))
+        for record, cmd in zip(records, cmds):
+            record['cmd'] = cmd.cmd_str & 0xFF
+            record['color'] = cmd.color
+            record['v0_x'] = cmd.v0_x
+            record['v1_x'] = cmd.v1_x
+            record['v2_x'] = cmd.v2_x
+            record['v0_y'] = cmd.v0_y
+            record['v1_y'] = cmd.v1_y
+            record['v2_y'] = cmd.v2_y
+        return records
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Command from one entry of a structured array
+        """
+        return cls(int(record['cmd']), int(record['color']), int(record['v0_x']), int(record['v1_x']),
+                   int(record['v2_x']), int(record['v0_y']), int(record['v1_y']), int(record['v2_y']))
 
     def get_bit_by_index(self, index: int) -> int:
         """
@@ -184,6 +233,152 @@ async def send_spi_cmd(cs_signal, sck_signal, mosi_signal, cmd: SPIcmd):
     mosi_signal.value = 0
 
 
+class SPIMaster:
+    """
+    Driver for the spi_master_bfm instance of a testbench
+
+    Whole command streams are handed to the BFM through its command file and clocked out by the simulator, with the
+    same waveform as send_spi_cmd
+    """
+    def __init__(self, bfm, path: str, sck_period_ns: int = 250, byte_gap_ns: int = 500, cs_idle_ns: int = 500):
+        self.bfm = bfm
+        self.path = path
+        self.sck_period_ns = sck_period_ns
+        self.byte_gap_ns = byte_gap_ns
+        self.cs_idle_ns = cs_idle_ns
+
+    async def send(self, cmds):
+        """
+        Send a stream of SPI commands back to back, returns once CS is released after the last one
+
+        cmds is a list of SPIcmd, a structured array of commands or (N, 7) wire bytes, see command_stream
+        """
+        assert len(cmds) <= SPI_BFM_DEPTH, "Command stream does not fit the BFM FIFO"
+
+        # done would only glitch for an empty stream
+        if len(cmds) == 0:
+            return
+
+        if not isinstance(cmds, np.ndarray):
+            cmds = SPIcmd.to_records(cmds)
+
+        with open(self.path, 'w') as f:
+            f.write(wire_to_memh(cmds) if is_wire(cmds) else cmds_to_memh(cmds))
+
+        self.bfm.count.value = len(cmds)
+        self.bfm.sck_period.value = self.sck_period_ns
+        self.bfm.byte_gap.value = self.byte_gap_ns
+        self.bfm.cs_idle.value = self.cs_idle_ns
+
+        self.bfm.start.value = 1
+        await RisingEdge(self.bfm.done)
+        self.bfm.start.value = 0
+
+
+# Register fields of one polygon slot
+SlotFields = namedtuple('SlotFields', ['color', 'v0_x', 'v1_x', 'v2_x', 'v0_y', 'v1_y', 'v2_y'])
+SLOT_FIELD_WIDTHS = SlotFields(color=WCOLOR, v0_x=WPX, v1_x=WPX, v2_x=WPX, v0_y=WPY, v1_y=WPY, v2_y=WPY)
+
+
+def poly_fields(poly: Polygon) -> SlotFields:
+    """
+    Register fields of a polygon, vertices compressed as the hardware stores them
+    """
+    return SlotFields(color=poly.raw_color, v0_x=int(poly.v0[0] / 8), v1_x=int(poly.v1[0] / 8), v2_x=int(poly.v2[0] / 8),
+                      v0_y=int(poly.v0[1] / 8), v1_y=int(poly.v1[1] / 8), v2_y=int(poly.v2[1] / 8))
+
+
+class PolygonSlots:
+    """
+    Packed polygon buses of a testbench, slot i sits at bits [w*(i+1)-1:w*i] of each bus
+
+    Handles are resolved once. Writes go through a shadow copy of every bus, so any number of slots is written with
+    one access per bus, and reads fetch each bus once for all slots
+    """
+    def __init__(self, buses: SlotFields, enable, n_slots: int = N_POLY):
+        self.buses = buses
+        self.enable = enable
+        self.n_slots = n_slots
+        self._values = [0] * len(buses)
+        self._enable = 0
+
+    @classmethod
+    def pixel_core(cls, dut):
+        """
+        Inputs of tb_pixel_core, owned by the bundle
+        """
+        return cls(SlotFields(color=dut.poly_color, v0_x=dut.v0_x, v1_x=dut.v1_x, v2_x=dut.v2_x,
+                              v0_y=dut.v0_y, v1_y=dut.v1_y, v2_y=dut.v2_y), dut.cmp_en)
+
+    @classmethod
+    def frontend(cls, dut):
+        """
+        Outputs of tb_frontend
+        """
+        return cls(SlotFields(color=dut.poly_color_out, v0_x=dut.v0_x_out, v1_x=dut.v1_x_out, v2_x=dut.v2_x_out,
+                              v0_y=dut.v0_y_out, v1_y=dut.v1_y_out, v2_y=dut.v2_y_out), dut.poly_enable_out)
+
+    def write(self, slots: dict):
+        """
+        Write {slot: (SlotFields, enable)} in one access per bus
+        """
+        for slot, (fields, enable) in slots.items():
+            assert 0 <= slot < self.n_slots, "No polygon slot " + str(slot)
+
+            for i, (value, width) in enumerate(zip(fields, SLOT_FIELD_WIDTHS)):
+                mask = ((1 << width) - 1) << (width * slot)
+                self._values[i] = (self._values[i] & ~mask) | ((int(value) << (width * slot)) & mask)
+
+            self._enable = (self._enable & ~(1 << slot)) | (int(bool(enable)) << slot)
+
+        for bus, value in zip(self.buses, self._values):
+            bus.value = value
+        self.enable.value = self._enable
+
+    def read(self) -> list:
+        """
+        SlotFields of every slot, one access per bus
+        """
+        values = [bus.value.integer for bus in self.buses]
+        return [SlotFields(*((value >> (width * slot)) & ((1 << width) - 1)
+                             for value, width in zip(values, SLOT_FIELD_WIDTHS)))
+                for slot in range(self.n_slots)]
+
+    def read_enables(self) -> list:
+        enable = self.enable.value.integer
+        return [(enable >> slot) & 1 for slot in range(self.n_slots)]
+
+
+def read_memh(path: str) -> np.ndarray:
+    """
+    Read a memory written by $writememh, undefined bits read as 0
+    """
+    words = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('//')[0]
+            for token in line.split():
+                # Address markers are not needed, memories are dumped in full
+                if token.startswith('@'):
+                    continue
+                words.append(int(token.lower().replace('x', '0').replace('z', '0').replace('_', ''), 16))
+
+    return np.array(words, dtype=np.int64)
+
+
+async def sweep_frame(dut, default_path: str) -> np.ndarray:
+    """
+    Run the pixel sweep engine of a core testbench and return its recorded (480, 640) frame of outputs
+
+    The sweep is started with a single write, the testbench dumps its memory to +sweep_file (default_path if unset)
+    """
+    dut.sweep_start.value = 1
+    await RisingEdge(dut.sweep_done)
+    dut.sweep_start.value = 0
+
+    return read_memh(cocotb.plusargs.get('sweep_file', default_path)).reshape(FRAME_HEIGHT, FRAME_WIDTH)
+
+
 def upscale_color(color : int) -> np.ndarray:
     """
     Upscale color into RGB channels from 6 bit integer form to 8 bit RGB
@@ -210,6 +405,25 @@ def upscale_color_from_components(c_red: int, c_green: int, c_blue: int) -> np.n
     return np.array([r_comp, g_comp, b_comp])
 
 
+def composite_polygons(polys: list, background_color: int, out: np.ndarray = None) -> np.ndarray:
+    """
+    Ground truth frame of 6 bit color indices for a list of polygon slots, highest priority first
+
+    Empty (None) or disabled slots are never rasterized, the frame is written into out if given
+    """
+    masks = np.zeros((len(polys), FRAME_HEIGHT, FRAME_WIDTH), dtype=bool)
+    colors = np.zeros(len(polys), dtype=np.uint8)
+    enables = np.zeros(len(polys), dtype=bool)
+
+    for slot, poly in enumerate(polys):
+        if poly is not None and poly.enable:
+            masks[slot] = poly.coverage()
+            colors[slot] = poly.raw_color
+            enables[slot] = True
+
+    return composite_frame(masks, colors, enables, background_color, out=out)
+
+
 def should_pixel_be_rasterized(v0, v1, v2, p_x, p_y, log=False):
     """
     Manual check of rasterization algorithm
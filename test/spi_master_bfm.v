@@ -0,0 +1,100 @@
+`default_nettype none
+`timescale 1ns / 1ps
+
+// SPI master bus functional model for the testbenches
+//
+// Commands are 56 bit words sent LSB first in SPI mode 0, with the same waveform as send_spi_cmd in shared_utils.
+// Python writes a stream of commands to CMD_FILE (or +spi_file) as hex words, sets count and raises start. The whole
+// stream is then clocked out in simulated time and done rises once CS is released after the last command.
+// Timing in ns is set through sck_period, byte_gap (before every byte) and cs_idle (CS high between commands).
+module spi_master_bfm #(
+    parameter CMD_FILE = "spi_cmds.hex",
+    parameter DEPTH = 4096
+) (
+    output reg sck,
+    output reg mosi,
+    output reg cs,
+    output reg active // High while the BFM owns the bus
+);
+
+  // Command FIFO, loaded in one go from CMD_FILE
+  reg [55:0] fifo [0:DEPTH-1];
+
+  // Control, written from Python
+  reg start;
+  reg done;
+  integer count;
+  integer sck_period;
+  integer byte_gap;
+  integer cs_idle;
+
+  reg [1023:0] cmd_file;
+  integer cmd_idx;
+  integer bit_idx;
+
+  initial begin
+    sck = 0;
+    mosi = 0;
+    cs = 1;
+    active = 0;
+    start = 0;
+    done = 0;
+    count = 0;
+    sck_period = 250;
+    byte_gap = 500;
+    cs_idle = 500;
+    if (!$value$plusargs("spi_file=%s", cmd_file))
+      cmd_file = CMD_FILE;
+  end
+
+  // Loop counters are 32 bit integers, truncating them to FIFO and bit indices is intended
+  /* verilator lint_off WIDTHTRUNC */
+  always @(posedge start) begin
+    done = 0;
+
+    // A stream longer than the FIFO would be clocked out with stale entries, stop the simulation instead
+    if (count > DEPTH) begin
+      $display("spi_master_bfm: %0d commands do not fit the FIFO of %0d", count, DEPTH);
+      $finish;
+    end
+
+    active = 1;
+
+    if (count > 0)
+      $readmemh(cmd_file, fifo, 0, count - 1);
+
+    for (cmd_idx = 0; cmd_idx < count; cmd_idx = cmd_idx + 1) begin
+      if (cmd_idx > 0)
+        #(cs_idle);
+
+      // CS down
+      cs = 0;
+
+      for (bit_idx = 0; bit_idx < 56; bit_idx = bit_idx + 1) begin
+        // Real micro typically has a delay in between sending each byte
+        if (bit_idx % 8 == 0) begin
+          sck = 0;
+          mosi = 0;
+          #(byte_gap);
+        end
+
+        // Set MOSI and throw one SPI clock
+        mosi = fifo[cmd_idx][bit_idx];
+        sck = 0;
+        #(sck_period / 2);
+        sck = 1;
+        #(sck_period / 2);
+      end
+
+      // CS back up
+      sck = 0;
+      cs = 1;
+      mosi = 0;
+    end
+
+    active = 0;
+    done = 1;
+  end
+  /* verilator lint_on WIDTHTRUNC */
+
+endmodule
@@ -5,11 +5,17 @@
 
 module tb_frontend ();
 
+`ifndef VERILATOR
+  reg [1023:0] dump_file;
+
   initial begin
-    $dumpfile("tb_frontend.vcd");
+    if (!$value$plusargs("dump_file=%s", dump_file))
+      dump_file = "tb_frontend.vcd";
+    $dumpfile(dump_file);
     $dumpvars(0, tb_frontend);
     #1;
   end
+`endif
 
   // Inputs
   reg clk;
@@ -68,14 +74,27 @@ module tb_frontend ();
   wire [`WPY-1:0] v2_y_d = v2_y_out[`WPY*4-1:`WPY*3];
   wire [`WCOLOR-1:0] color_d = poly_color_out[`WCOLOR*4-1:`WCOLOR*3];
 
+  // SPI master BFM, takes over the bus from the regs above while it streams commands
+  wire spi_bfm_sck;
+  wire spi_bfm_mosi;
+  wire spi_bfm_cs;
+  wire spi_bfm_active;
+
+  spi_master_bfm #(.CMD_FILE("tb_frontend_spi.hex")) spi_bfm (
+    .sck(spi_bfm_sck),
+    .mosi(spi_bfm_mosi),
+    .cs(spi_bfm_cs),
+    .active(spi_bfm_active)
+  );
+
   tt_um_emern_frontend user_project (
     .clk(clk),
     .rst_n(rst_n),
 
-    .cs_in(cs_in),
-    .mosi_in(mosi_in),
+    .cs_in(spi_bfm_active ? spi_bfm_cs : cs_in),
+    .mosi_in(spi_bfm_active ? spi_bfm_mosi : mosi_in),
     .miso_out(miso_out),
-    .sck_in(sck_in),
+    .sck_in(spi_bfm_active ? spi_bfm_sck : sck_in),
     .en_load(en_load),
 
     .bg_color_out(bg_color_out),
@@ -3,11 +3,17 @@
 
 module tb_inverse ();
 
+`ifndef VERILATOR
+  reg [1023:0] dump_file;
+
   initial begin
-    $dumpfile("tb_inverse.vcd");
+    if (!$value$plusargs("dump_file=%s", dump_file))
+      dump_file = "tb_inverse.vcd";
+    $dumpfile(dump_file);
     $dumpvars(0, tb_inverse);
     #1;
   end
+`endif
 
   reg [12:0] determinant; // packed determinant, signed
 
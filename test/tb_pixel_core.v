@@ -4,12 +4,18 @@
 
 module tb_pixel_core ();
 
-  // Dump the signals to a VCD file. You can view it with gtkwave.
+  // Dump the signals to a VCD file (+dump_file sets its name). You can view it with gtkwave.
+`ifndef VERILATOR
+  reg [1023:0] dump_file;
+
   initial begin
-    $dumpfile("tb_pixel_core.vcd");
+    if (!$value$plusargs("dump_file=%s", dump_file))
+      dump_file = "tb_pixel_core.vcd";
+    $dumpfile(dump_file);
     $dumpvars(0, tb_pixel_core);
     #1;
   end
+`endif
 
   // Direct to DUT parameters
   reg clk;
@@ -19,56 +25,52 @@ module tb_pixel_core ();
   reg [`WCOLOR-1:0] background_color;
   reg [`WCOLOR-1:0] pixel_out;
 
-  // Setable TB parameters, its easier to do the slicing here than with cocotb
-  reg [`WPX-1:0] v0_x_a;
-  reg [`WPX-1:0] v0_x_b;
-  reg [`WPX-1:0] v0_x_c;
-  reg [`WPX-1:0] v0_x_d;
-
-  reg [`WPY-1:0] v0_y_a;
-  reg [`WPY-1:0] v0_y_b;
-  reg [`WPY-1:0] v0_y_c;
-  reg [`WPY-1:0] v0_y_d;
-
-  reg [`WPX-1:0] v1_x_a;
-  reg [`WPX-1:0] v1_x_b;
-  reg [`WPX-1:0] v1_x_c;
-  reg [`WPX-1:0] v1_x_d;
-
-  reg [`WPY-1:0] v1_y_a;
-  reg [`WPY-1:0] v1_y_b;
-  reg [`WPY-1:0] v1_y_c;
-  reg [`WPY-1:0] v1_y_d;
-
-  reg [`WPX-1:0] v2_x_a;
-  reg [`WPX-1:0] v2_x_b;
-  reg [`WPX-1:0] v2_x_c;
-  reg [`WPX-1:0] v2_x_d;
-
-  reg [`WPY-1:0] v2_y_a;
-  reg [`WPY-1:0] v2_y_b;
-  reg [`WPY-1:0] v2_y_c;
-  reg [`WPY-1:0] v2_y_d;
-
-  reg [`WCOLOR-1:0] poly_color_a;
-  reg [`WCOLOR-1:0] poly_color_b;
-  reg [`WCOLOR-1:0] poly_color_c;
-  reg [`WCOLOR-1:0] poly_color_d;
-
-  reg en_a;
-  reg en_b;
-  reg en_c;
-  reg en_d;
-
-  // Pack bus {a_params, b_params}
-  wire [`WPX*`N_POLY-1:0] v0_x = {v0_x_d, v0_x_c, v0_x_b, v0_x_a};
-  wire [`WPY*`N_POLY-1:0] v0_y = {v0_y_d, v0_y_c, v0_y_b, v0_y_a};
-  wire [`WPX*`N_POLY-1:0] v1_x = {v1_x_d, v1_x_c, v1_x_b, v1_x_a};
-  wire [`WPY*`N_POLY-1:0] v1_y = {v1_y_d, v1_y_c, v1_y_b, v1_y_a};
-  wire [`WPX*`N_POLY-1:0] v2_x = {v2_x_d, v2_x_c, v2_x_b, v2_x_a};
-  wire [`WPY*`N_POLY-1:0] v2_y = {v2_y_d, v2_y_c, v2_y_b, v2_y_a};
-  wire [`WCOLOR*`N_POLY-1:0] poly_color = {poly_color_d, poly_color_c, poly_color_b, poly_color_a};
-  wire [`N_POLY-1:0] cmp_en = {en_d, en_c, en_b, en_a};
+  // Packed polygon buses, written a whole slot at a time by PolygonSlots in shared_utils
+  reg [`WPX*`N_POLY-1:0] v0_x;
+  reg [`WPY*`N_POLY-1:0] v0_y;
+  reg [`WPX*`N_POLY-1:0] v1_x;
+  reg [`WPY*`N_POLY-1:0] v1_y;
+  reg [`WPX*`N_POLY-1:0] v2_x;
+  reg [`WPY*`N_POLY-1:0] v2_y;
+  reg [`WCOLOR*`N_POLY-1:0] poly_color;
+  reg [`N_POLY-1:0] cmp_en;
+
+  // Per slot views of the buses for waveforms
+  wire [`WPX-1:0] v0_x_a = v0_x[`WPX-1:0];
+  wire [`WPY-1:0] v0_y_a = v0_y[`WPY-1:0];
+  wire [`WPX-1:0] v1_x_a = v1_x[`WPX-1:0];
+  wire [`WPY-1:0] v1_y_a = v1_y[`WPY-1:0];
+  wire [`WPX-1:0] v2_x_a = v2_x[`WPX-1:0];
+  wire [`WPY-1:0] v2_y_a = v2_y[`WPY-1:0];
+  wire [`WCOLOR-1:0] poly_color_a = poly_color[`WCOLOR-1:0];
+  wire en_a = cmp_en[0];
+
+  wire [`WPX-1:0] v0_x_b = v0_x[`WPX*2-1:`WPX];
+  wire [`WPY-1:0] v0_y_b = v0_y[`WPY*2-1:`WPY];
+  wire [`WPX-1:0] v1_x_b = v1_x[`WPX*2-1:`WPX];
+  wire [`WPY-1:0] v1_y_b = v1_y[`WPY*2-1:`WPY];
+  wire [`WPX-1:0] v2_x_b = v2_x[`WPX*2-1:`WPX];
+  wire [`WPY-1:0] v2_y_b = v2_y[`WPY*2-1:`WPY];
+  wire [`WCOLOR-1:0] poly_color_b = poly_color[`WCOLOR*2-1:`WCOLOR];
+  wire en_b = cmp_en[1];
+
+  wire [`WPX-1:0] v0_x_c = v0_x[`WPX*3-1:`WPX*2];
+  wire [`WPY-1:0] v0_y_c = v0_y[`WPY*3-1:`WPY*2];
+  wire [`WPX-1:0] v1_x_c = v1_x[`WPX*3-1:`WPX*2];
+  wire [`WPY-1:0] v1_y_c = v1_y[`WPY*3-1:`WPY*2];
+  wire [`WPX-1:0] v2_x_c = v2_x[`WPX*3-1:`WPX*2];
+  wire [`WPY-1:0] v2_y_c = v2_y[`WPY*3-1:`WPY*2];
+  wire [`WCOLOR-1:0] poly_color_c = poly_color[`WCOLOR*3-1:`WCOLOR*2];
+  wire en_c = cmp_en[2];
+
+  wire [`WPX-1:0] v0_x_d = v0_x[`WPX*4-1:`WPX*3];
+  wire [`WPY-1:0] v0_y_d = v0_y[`WPY*4-1:`WPY*3];
+  wire [`WPX-1:0] v1_x_d = v1_x[`WPX*4-1:`WPX*3];
+  wire [`WPY-1:0] v1_y_d = v1_y[`WPY*4-1:`WPY*3];
+  wire [`WPX-1:0] v2_x_d = v2_x[`WPX*4-1:`WPX*3];
+  wire [`WPY-1:0] v2_y_d = v2_y[`WPY*4-1:`WPY*3];
+  wire [`WCOLOR-1:0] poly_color_d = poly_color[`WCOLOR*4-1:`WCOLOR*3];
+  wire en_d = cmp_en[3];
 
 
   // Device under test
@@ -89,4 +91,47 @@ module tb_pixel_core ();
     .pixel_out(pixel_out) // Output color for that pixel, rrggbb
   );
 
+  // Pixel sweep: a rising edge on sweep_start walks every pixel of the frame in row major order, one clock each,
+  // and records the registered pixel_out into sweep_mem. Addresses change on the falling edge and results are
+  // collected on the following falling edge. The memory is written to +sweep_file (tb_pixel_core_sweep.hex by
+  // default) with $writememh before sweep_done rises
+  localparam SWEEP_COLS = 640;
+  localparam SWEEP_ROWS = 480;
+
+  reg sweep_start;
+  reg sweep_done;
+  reg [`WCOLOR-1:0] sweep_mem [0:SWEEP_COLS*SWEEP_ROWS-1];
+  reg [1023:0] sweep_file;
+  integer sweep_idx;
+
+  initial begin
+    sweep_start = 0;
+    sweep_done = 0;
+    if (!$value$plusargs("sweep_file=%s", sweep_file))
+      sweep_file = "tb_pixel_core_sweep.hex";
+  end
+
+  // Loop counters are 32 bit integers, truncating them to memory indices and pixel addresses is intended
+  /* verilator lint_off WIDTHTRUNC */
+  always @(posedge sweep_start) begin
+    sweep_done = 0;
+
+    @(negedge clk);
+    pixel_col = 0;
+    pixel_row = 0;
+
+    for (sweep_idx = 0; sweep_idx < SWEEP_COLS*SWEEP_ROWS; sweep_idx = sweep_idx + 1) begin
+      @(negedge clk);
+      sweep_mem[sweep_idx] = pixel_out;
+      if (sweep_idx < SWEEP_COLS*SWEEP_ROWS - 1) begin
+        pixel_col = (sweep_idx + 1) % SWEEP_COLS;
+        pixel_row = (sweep_idx + 1) / SWEEP_COLS;
+      end
+    end
+
+    $writememh(sweep_file, sweep_mem);
+    sweep_done = 1;
+  end
+  /* verilator lint_on WIDTHTRUNC */
+
 endmodule
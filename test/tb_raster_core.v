@@ -3,12 +3,18 @@
 
 module tb_raster_core ();
 
-  // Dump the signals to a VCD file. You can view it with gtkwave.
+  // Dump the signals to a VCD file (+dump_file sets its name). You can view it with gtkwave.
+`ifndef VERILATOR
+  reg [1023:0] dump_file;
+
   initial begin
-    $dumpfile("tb_raster_core.vcd");
+    if (!$value$plusargs("dump_file=%s", dump_file))
+      dump_file = "tb_raster_core.vcd";
+    $dumpfile(dump_file);
     $dumpvars(0, tb_raster_core);
     #1;
   end
+`endif
 
   // Wire up the inputs and outputs:
     reg [9:0] pixel_col;
@@ -41,4 +47,41 @@ module tb_raster_core ();
     .rasterize(rasterize)
   );
 
+  // Pixel sweep: a rising edge on sweep_start walks every pixel of the frame in row major order, holding each for
+  // one 40ns step, and records rasterize into sweep_mem. The memory is written to +sweep_file
+  // (tb_raster_core_sweep.hex by default) with $writememh before sweep_done rises
+  localparam SWEEP_COLS = 640;
+  localparam SWEEP_ROWS = 480;
+
+  reg sweep_start;
+  reg sweep_done;
+  reg [0:0] sweep_mem [0:SWEEP_COLS*SWEEP_ROWS-1];
+  reg [1023:0] sweep_file;
+  integer sweep_row;
+  integer sweep_col;
+
+  initial begin
+    sweep_start = 0;
+    sweep_done = 0;
+    if (!$value$plusargs("sweep_file=%s", sweep_file))
+      sweep_file = "tb_raster_core_sweep.hex";
+  end
+
+  // Loop counters are 32 bit integers, truncating them to memory indices and pixel addresses is intended
+  /* verilator lint_off WIDTHTRUNC */
+  always @(posedge sweep_start) begin
+    sweep_done = 0;
+    for (sweep_row = 0; sweep_row < SWEEP_ROWS; sweep_row = sweep_row + 1) begin
+      for (sweep_col = 0; sweep_col < SWEEP_COLS; sweep_col = sweep_col + 1) begin
+        pixel_col = sweep_col[9:0];
+        pixel_row = sweep_row[8:0];
+        #40;
+        sweep_mem[sweep_row*SWEEP_COLS + sweep_col] = rasterize;
+      end
+    end
+    $writememh(sweep_file, sweep_mem);
+    sweep_done = 1;
+  end
+  /* verilator lint_on WIDTHTRUNC */
+
 endmodule
@@ -3,12 +3,18 @@
 
 module tb_top ();
 
-  // Dump the signals to a VCD file. You can view it with gtkwave.
+  // Dump the signals to a VCD file (+dump_file sets its name). You can view it with gtkwave.
+`ifndef VERILATOR
+  reg [1023:0] dump_file;
+
   initial begin
-    $dumpfile("tb_top.vcd");
+    if (!$value$plusargs("dump_file=%s", dump_file))
+      dump_file = "tb_top.vcd";
+    $dumpfile(dump_file);
     // $dumpvars(0, tb_top);
     #1;
   end
+`endif
 
   // Wire up the inputs and outputs:
   reg clk;
@@ -20,22 +26,78 @@ module tb_top ();
   wire [7:0] uio_out;
   wire [7:0] uio_oe;
 
+  // Color outputs are 2 bits, the 3 bit views zero extend them
+  /* verilator lint_off WIDTHEXPAND */
   wire [2:0] red_out = {uo_out[0], uo_out[4]};
   wire [2:0] green_out = {uo_out[1], uo_out[5]};
   wire [2:0] blue_out = {uo_out[2], uo_out[6]};
+  /* verilator lint_on WIDTHEXPAND */
   wire hsync = uo_out[7];
   wire vsync = uo_out[3];
 
-  wire spi_sck;
-  wire spi_mosi;
-  wire spi_cs;
+  reg spi_sck;
+  reg spi_mosi;
+  reg spi_cs;
+
+  // SPI master BFM, takes over the bus from the regs above while it streams commands
+  wire spi_bfm_sck;
+  wire spi_bfm_mosi;
+  wire spi_bfm_cs;
+  wire spi_bfm_active;
+
+  spi_master_bfm #(.CMD_FILE("tb_top_spi.hex")) spi_bfm (
+      .sck(spi_bfm_sck),
+      .mosi(spi_bfm_mosi),
+      .cs(spi_bfm_cs),
+      .active(spi_bfm_active)
+  );
 
-  assign uio_in[3] = spi_sck;
-  assign uio_in[1] = spi_mosi;
-  assign uio_in[0] = spi_cs;
+  assign uio_in[3] = spi_bfm_active ? spi_bfm_sck : spi_sck;
+  assign uio_in[1] = spi_bfm_active ? spi_bfm_mosi : spi_mosi;
+  assign uio_in[0] = spi_bfm_active ? spi_bfm_cs : spi_cs;
 
   wire int_out = uio_out[4];
 
+  // Frame capture: while capture_en is high, one little endian 32 bit record per clock is streamed to
+  // +capture_file (tb_top_capture.bin by default) as {int_out, vsync, hsync, red, green, blue}. Records are
+  // sampled on the falling edge, record k holds the outputs after the (k+1)th rising edge out of reset.
+  // The file is reopened on every rising edge of capture_en and flushed whenever capture_flush toggles or
+  // capture_en falls, the harness toggles capture_flush before it reads a frame back.
+  reg capture_en;
+  reg capture_flush;
+  reg capture_valid;
+  integer capture_fd;
+  reg [1023:0] capture_file;
+
+  initial begin
+    capture_en = 0;
+    capture_flush = 0;
+    capture_valid = 0;
+    capture_fd = 0;
+    if (!$value$plusargs("capture_file=%s", capture_file))
+      capture_file = "tb_top_capture.bin";
+  end
+
+  always @(posedge capture_en) begin
+    if (capture_fd != 0)
+      $fclose(capture_fd);
+    capture_fd = $fopen(capture_file, "wb");
+  end
+
+  always @(posedge clk) begin
+    capture_valid <= rst_n;
+  end
+
+  always @(negedge clk) begin
+    if (capture_en && capture_valid && capture_fd != 0)
+      $fwrite(capture_fd, "%u", {23'b0, int_out, vsync, hsync, red_out[1:0], green_out[1:0], blue_out[1:0]});
+  end
+
+  always @(capture_flush or negedge capture_en) begin
+    if (capture_fd != 0)
+      $fflush(capture_fd);
+  end
+
   // Replace tt_um_example with your module name:
   tt_um_emern_top user_project (
 
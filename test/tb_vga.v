@@ -3,11 +3,17 @@
 
 module tb_vga ();
 
+`ifndef VERILATOR
+  reg [1023:0] dump_file;
+
   initial begin
-    $dumpfile("tb_vga.vcd");
+    if (!$value$plusargs("dump_file=%s", dump_file))
+      dump_file = "tb_vga.vcd";
+    $dumpfile(dump_file);
     $dumpvars(0, tb_vga);
     #1;
   end
+`endif
 
 	reg clk;
 	reg rst_n;
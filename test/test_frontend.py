@@ -9,8 +9,13 @@ import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import ClockCycles, Timer
 import random
-from shared_utils import SPIcmd, send_spi_cmd
+from shared_utils import SPIcmd, SPIMaster, PolygonSlots, SlotFields, send_spi_cmd
 import shared_utils as shared
+from profiling import profile_tests
+
+# Command file of the SPI master BFM, see tb_frontend.v
+SPI_CMD_PATH = 'tb_frontend_spi.hex'
+
 
 async def reset_dut(dut):
     """
@@ -32,55 +37,54 @@ async def reset_dut(dut):
     await ClockCycles(dut.clk, 1)
 
 
+# Polygon outputs of the testbench, resolved on first use
+_slots = None
+
+
+def polygon_slots(dut) -> PolygonSlots:
+    """
+    Shared polygon slot bundle of the testbench
+    """
+    global _slots
+    if _slots is None:
+        _slots = PolygonSlots.frontend(dut)
+    return _slots
+
+
+def check_poly(dut, slot: int, color: int, v0_x: int, v1_x: int, v2_x: int, v0_y: int, v1_y: int, v2_y: int):
+    """
+    Check stored output of a polygon slot
+    """
+    assert polygon_slots(dut).read()[slot] == SlotFields(color=color, v0_x=v0_x, v1_x=v1_x, v2_x=v2_x,
+                                                         v0_y=v0_y, v1_y=v1_y, v2_y=v2_y)
+
+
 def check_poly_a(dut, color: int, v0_x: int, v1_x: int, v2_x: int, v0_y: int, v1_y: int, v2_y: int):
     """
     Check polygon A stored output
     """
-    assert (dut.color_a.value.integer) == color
-    assert (dut.v0_x_a.value.integer) == v0_x
-    assert (dut.v1_x_a.value.integer) == v1_x
-    assert (dut.v2_x_a.value.integer) == v2_x
-    assert (dut.v0_y_a.value.integer) == v0_y
-    assert (dut.v1_y_a.value.integer) == v1_y
-    assert (dut.v2_y_a.value.integer) == v2_y
+    check_poly(dut, 0, color=color, v0_x=v0_x, v1_x=v1_x, v2_x=v2_x, v0_y=v0_y, v1_y=v1_y, v2_y=v2_y)
 
 
 def check_poly_b(dut, color: int, v0_x: int, v1_x: int, v2_x: int, v0_y: int, v1_y: int, v2_y: int):
     """
     Check polygon B stored output
     """
-    assert (dut.color_b.value.integer) == color
-    assert (dut.v0_x_b.value.integer) == v0_x
-    assert (dut.v1_x_b.value.integer) == v1_x
-    assert (dut.v2_x_b.value.integer) == v2_x
-    assert (dut.v0_y_b.value.integer) == v0_y
-    assert (dut.v1_y_b.value.integer) == v1_y
-    assert (dut.v2_y_b.value.integer) == v2_y
+    check_poly(dut, 1, color=color, v0_x=v0_x, v1_x=v1_x, v2_x=v2_x, v0_y=v0_y, v1_y=v1_y, v2_y=v2_y)
 
 
 def check_poly_c(dut, color: int, v0_x: int, v1_x: int, v2_x: int, v0_y: int, v1_y: int, v2_y: int):
     """
     Check polygon C stored output
     """
-    assert (dut.color_c.value.integer) == color
-    assert (dut.v0_x_c.value.integer) == v0_x
-    assert (dut.v1_x_c.value.integer) == v1_x
-    assert (dut.v2_x_c.value.integer) == v2_x
-    assert (dut.v0_y_c.value.integer) == v0_y
-    assert (dut.v1_y_c.value.integer) == v1_y
-    assert (dut.v2_y_c.value.integer) == v2_y
+    check_poly(dut, 2, color=color, v0_x=v0_x, v1_x=v1_x, v2_x=v2_x, v0_y=v0_y, v1_y=v1_y, v2_y=v2_y)
+
 
 def check_poly_d(dut, color: int, v0_x: int, v1_x: int, v2_x: int, v0_y: int, v1_y: int, v2_y: int):
     """
     Check polygon D stored output
     """
-    assert (dut.color_d.value.integer) == color
-    assert (dut.v0_x_d.value.integer) == v0_x
-    assert (dut.v1_x_d.value.integer) == v1_x
-    assert (dut.v2_x_d.value.integer) == v2_x
-    assert (dut.v0_y_d.value.integer) == v0_y
-    assert (dut.v1_y_d.value.integer) == v1_y
-    assert (dut.v2_y_d.value.integer) == v2_y
+    check_poly(dut, 3, color=color, v0_x=v0_x, v1_x=v1_x, v2_x=v2_x, v0_y=v0_y, v1_y=v1_y, v2_y=v2_y)
 
 
 def check_poly_enable(dut, enable_a: int, enable_b: int, enable_c=0, enable_d=0):
@@ -881,3 +885,117 @@ async def test_send_bad_cmd(dut):
     # Both Polys should have the correct data
     check_poly_a(dut, color=shared.COLOR_RED, v0_x=40, v0_y=12, v2_x=22, v1_x=11, v1_y=14, v2_y=17)
     check_poly_enable(dut, enable_a=1, enable_b=0)
+
+
+@cocotb.test()
+async def test_command_stream(dut):
+    """
+    Test a long stream of back to back writes clocked out by the SPI master BFM
+    """
+
+    dut._log.info("Start")
+
+    clock = Clock(dut.clk, 40, units="ns") # Main clock is 25Mhz to match VGA
+    cocotb.start_soon(clock.start())
+
+    # Reset - Since the screen has been fully disabled, we should be able to write commands
+    await reset_dut(dut)
+    dut.en_load.value = 1
+
+    # Wait a small amount before sending the commands
+    await Timer(50, units='ns')
+
+    # Random writes to every polygon slot, the last write to each slot has to win
+    slots = [shared.SPI_CMD_WRITE_POLY_A, shared.SPI_CMD_WRITE_POLY_B, shared.SPI_CMD_WRITE_POLY_C, shared.SPI_CMD_WRITE_POLY_D]
+    cmds = []
+    for slot in [random.choice(slots) for _ in range(200)] + slots:
+        # generate_random only fuzzes A and B, so draw parameters as for A and address the chosen slot
+        params = SPIcmd.generate_random(shared.SPI_CMD_WRITE_POLY_A)
+        cmds.append(SPIcmd(cmd=slot, color=params.color, v0_x=params.v0_x, v1_x=params.v1_x, v2_x=params.v2_x,
+                           v0_y=params.v0_y, v1_y=params.v1_y, v2_y=params.v2_y))
+
+    await SPIMaster(dut.spi_bfm, cocotb.plusargs.get('spi_file', SPI_CMD_PATH)).send(cmds)
+
+    # Wait a few clock cycles on DUT side
+    await ClockCycles(dut.clk, 2)
+    await Timer(1, units='ns')
+
+    last = {cmd.cmd_str & 0xFF: cmd for cmd in cmds}
+
+    # Background and screen enable CMDs should not have changed
+    assert dut.bg_color_out.value == 0
+
+    # Every slot is read back in one access per bus
+    stored = polygon_slots(dut).read()
+    for index, slot in enumerate(slots):
+        cmd = last[slot]
+        assert stored[index] == SlotFields(color=cmd.color, v0_x=cmd.v0_x, v1_x=cmd.v1_x, v2_x=cmd.v2_x,
+                                           v0_y=cmd.v0_y, v1_y=cmd.v1_y, v2_y=cmd.v2_y)
+    check_poly_enable(dut, enable_a=1, enable_b=1, enable_c=1, enable_d=1)
+
+
+@cocotb.test()
+async def test_bfm_timing(dut):
+    """
+    Test commands clocked out by the SPI master BFM with non default SCK period, byte gap and CS idle time, then a
+    shorter stream with the default timing, which has to reload the command file
+    """
+
+    dut._log.info("Start")
+
+    clock = Clock(dut.clk, 40, units="ns") # Main clock is 25Mhz to match VGA
+    cocotb.start_soon(clock.start())
+
+    # Reset - Since the screen has been fully disabled, we should be able to write commands
+    await reset_dut(dut)
+    dut.en_load.value = 1
+
+    # Wait a small amount before sending the commands
+    await Timer(50, units='ns')
+
+    slots = [shared.SPI_CMD_WRITE_POLY_A, shared.SPI_CMD_WRITE_POLY_B, shared.SPI_CMD_WRITE_POLY_C, shared.SPI_CMD_WRITE_POLY_D]
+    path = cocotb.plusargs.get('spi_file', SPI_CMD_PATH)
+
+    def random_writes() -> list:
+        # generate_random only fuzzes A and B, so draw parameters as for A and address each slot
+        cmds = []
+        for slot in slots:
+            params = SPIcmd.generate_random(shared.SPI_CMD_WRITE_POLY_A)
+            cmds.append(SPIcmd(cmd=slot, color=params.color, v0_x=params.v0_x, v1_x=params.v1_x, v2_x=params.v2_x,
+                               v0_y=params.v0_y, v1_y=params.v1_y, v2_y=params.v2_y))
+        return cmds
+
+    def check_slots(cmds: list):
+        stored = polygon_slots(dut).read()
+        for index, cmd in enumerate(cmds):
+            assert stored[index] == SlotFields(color=cmd.color, v0_x=cmd.v0_x, v1_x=cmd.v1_x, v2_x=cmd.v2_x,
+                                               v0_y=cmd.v0_y, v1_y=cmd.v1_y, v2_y=cmd.v2_y)
+
+    # Slow SCK, no gap between bytes and CS high for only three clocks between commands
+    first = random_writes()
+    background = SPIcmd(cmd=shared.SPI_CMD_SET_BG_COLOR, color=shared.COLOR_GREEN, v0_x=0, v1_x=0, v2_x=0, v0_y=0, v1_y=0, v2_y=0)
+    await SPIMaster(dut.spi_bfm, path, sck_period_ns=800, byte_gap_ns=0, cs_idle_ns=120).send(first + [background])
+
+    # Wait a few clock cycles on DUT side
+    await ClockCycles(dut.clk, 2)
+    await Timer(1, units='ns')
+
+    check_slots(first)
+    assert dut.bg_color_out.value == shared.COLOR_GREEN
+    check_poly_enable(dut, enable_a=1, enable_b=1, enable_c=1, enable_d=1)
+
+    # Default timing, fewer commands than the stream before
+    second = random_writes()[:2]
+    await SPIMaster(dut.spi_bfm, path).send(second)
+
+    await ClockCycles(dut.clk, 2)
+    await Timer(1, units='ns')
+
+    check_slots(second + first[2:])
+    assert dut.bg_color_out.value == shared.COLOR_GREEN
+
+    dut._log.info("Finished")
+
+
+# Profile every test above when PROFILE_TESTS=1
+profile_tests(globals())
@@ -10,7 +10,9 @@ import cocotb
 import cocotb.binary
 from cocotb.triggers import Timer
 import numpy as np
-from fxpmath import Fxp
+from inverse_model import inverse_lut, load_error_table, DET_BITS, DET_POS_BITS, FRAC_BITS, INV_DET_BITS
+from fixed_point import decode
+from profiling import profile_tests
 
 
 def gt_estimation(val, log=False):
@@ -58,21 +60,6 @@ def gt_estimation(val, log=False):
     return reciprocal / (1 << amount)
 
 
-def fixed_to_floating(val, fractional_bits):
-    """
-    Convert fixed point string into floating point number
-    """
-    c = abs(val)
-    sign = 1 
-    if val < 0:
-        # convert back from two's complement
-        c = val - 1 
-        c = ~c
-        sign = -1
-    f = (1.0 * c) / (2 ** fractional_bits)
-    f = f * sign
-    return f
-
 def print_internal_state(dut):
     """
     Print ray tracer core internal state for debugging
@@ -80,14 +67,14 @@ def print_internal_state(dut):
 
     print("--Core internals--")
 
-    print(fixed_to_floating(dut.user_project.a.value.signed_integer, 23))
-    print(fixed_to_floating(dut.user_project.b.value.signed_integer, 23))
-    print(fixed_to_floating(dut.user_project.c.value.signed_integer, 46))
-    print(fixed_to_floating(dut.user_project.d.value.signed_integer, 23))
-    print(fixed_to_floating(dut.user_project.e.value.signed_integer, 46))
-    print(fixed_to_floating(dut.user_project.f.value.signed_integer, 23))
-    print(fixed_to_floating(dut.user_project.inv_det_full.value.signed_integer, 23))
-    print(fixed_to_floating(dut.inv_det.value.integer, 23))
+    print(decode(dut.user_project.a.value.integer, 27, 23))
+    print(decode(dut.user_project.b.value.integer, 27, 23))
+    print(decode(dut.user_project.c.value.integer, 50, 46))
+    print(decode(dut.user_project.d.value.integer, 27, 23))
+    print(decode(dut.user_project.e.value.integer, 50, 46))
+    print(decode(dut.user_project.f.value.integer, 27, 23))
+    print(decode(dut.user_project.inv_det_full.value.integer, 39, 23))
+    print(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False))
 
 
 @cocotb.test()
@@ -111,10 +98,10 @@ async def test_number_1(dut):
     # Log result
     dut._log.info("Ground truth: " + str(gt))
     dut._log.info("Ground truth estimate: " + str(estimation))
-    dut._log.info("DUT result: " + str(fixed_to_floating(dut.inv_det.value.integer, 23)))
+    dut._log.info("DUT result: " + str(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False)))
 
     # Result should be within 20% of actual, appropriate sign
-    assert abs(fixed_to_floating(dut.inv_det.value.integer, 23) - abs(gt)) / abs(gt) < 0.2
+    assert abs(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False) - abs(gt)) / abs(gt) < 0.2
     assert dut.inv_det_negative.value.integer == 0
 
     dut._log.info("Finished")
@@ -141,10 +128,10 @@ async def test_number_2(dut):
     # Log result
     dut._log.info("Ground truth: " + str(gt))
     dut._log.info("Ground truth estimate: " + str(estimation))
-    dut._log.info("DUT result: " + str(fixed_to_floating(dut.inv_det.value.integer, 23)))
+    dut._log.info("DUT result: " + str(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False)))
 
     # Result should be within 20% of actual, appropriate sign
-    assert abs(fixed_to_floating(dut.inv_det.value.integer, 23) - abs(gt)) / abs(gt) < 0.2
+    assert abs(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False) - abs(gt)) / abs(gt) < 0.2
     assert dut.inv_det_negative.value.integer == 1
 
     dut._log.info("Finished")
@@ -171,10 +158,10 @@ async def test_number_3(dut):
     # Log result
     dut._log.info("Ground truth: " + str(gt))
     dut._log.info("Ground truth estimate: " + str(estimation))
-    dut._log.info("DUT result: " + str(fixed_to_floating(dut.inv_det.value.integer, 23)))
+    dut._log.info("DUT result: " + str(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False)))
 
     # Result should be within 20% of actual, appropriate sign
-    assert abs(fixed_to_floating(dut.inv_det.value.integer, 23) - abs(gt)) / abs(gt) < 0.2
+    assert abs(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False) - abs(gt)) / abs(gt) < 0.2
     assert dut.inv_det_negative.value.integer == 0
 
     dut._log.info("Finished")
@@ -201,10 +188,10 @@ async def test_number_4(dut):
     # Log result
     dut._log.info("Ground truth: " + str(gt))
     dut._log.info("Ground truth estimate: " + str(estimation))
-    dut._log.info("DUT result: " + str(fixed_to_floating(dut.inv_det.value.integer, 23)))
+    dut._log.info("DUT result: " + str(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False)))
 
     # Result should be within 20% of actual, appropriate sign
-    assert abs(fixed_to_floating(dut.inv_det.value.integer, 23) - abs(gt)) / abs(gt) < 0.2
+    assert abs(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False) - abs(gt)) / abs(gt) < 0.2
     assert dut.inv_det_negative.value.integer == 1
 
     dut._log.info("Finished")
@@ -232,10 +219,10 @@ async def test_number_5(dut):
     # Log result
     dut._log.info("Ground truth: " + str(gt))
     dut._log.info("Ground truth estimate: " + str(estimation))
-    dut._log.info("DUT result: " + str(fixed_to_floating(dut.inv_det.value.integer, 23)))
+    dut._log.info("DUT result: " + str(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False)))
 
     # Result should be within 20% of actual, appropriate sign
-    assert abs(fixed_to_floating(dut.inv_det.value.integer, 23) - abs(gt)) / abs(gt) < 0.2
+    assert abs(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False) - abs(gt)) / abs(gt) < 0.2
     assert dut.inv_det_negative.value.integer == 0
 
     dut._log.info("Finished")
@@ -263,10 +250,51 @@ async def test_number_6(dut):
     # Log result
     dut._log.info("Ground truth: " + str(gt))
     dut._log.info("Ground truth estimate: " + str(estimation))
-    dut._log.info("DUT result: " + str(fixed_to_floating(dut.inv_det.value.integer, 23)))
+    dut._log.info("DUT result: " + str(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False)))
 
     # Result should be within 20% of actual, appropriate sign
-    assert abs(fixed_to_floating(dut.inv_det.value.integer, 23) - abs(gt)) / abs(gt) < 0.2
+    assert abs(decode(dut.inv_det.value.integer, INV_DET_BITS, FRAC_BITS, signed=False) - abs(gt)) / abs(gt) < 0.2
     assert dut.inv_det_negative.value.integer == 1
 
-    dut._log.info("Finished")
\ No newline at end of file
+    dut._log.info("Finished")
+
+
+@cocotb.test()
+async def test_all_inputs(dut):
+    """
+    Sweep the whole 13 bit input domain against the bit exact model
+    """
+    dut._log.info("Start")
+
+    lut_inv_det, lut_negative = inverse_lut()
+    error_table = load_error_table()
+
+    gen_inv_det = np.zeros(1 << DET_BITS, dtype=np.int64)
+    gen_negative = np.zeros(1 << DET_BITS, dtype=np.int64)
+
+    for det in range(1 << DET_BITS):
+        dut.determinant.value = det
+
+        await Timer(40, units="ns")
+
+        gen_inv_det[det] = dut.inv_det.value.integer
+        gen_negative[det] = dut.inv_det_negative.value.integer
+
+    # Every output should exactly match the model
+    mismatches = np.count_nonzero((gen_inv_det != lut_inv_det) | (gen_negative != lut_negative))
+    dut._log.info("Model mismatches: " + str(mismatches))
+    assert mismatches == 0
+
+    # Positive inputs should stay within the persisted error of their octave
+    det_pos = np.arange(1, 1 << DET_POS_BITS)
+    rel_error = np.abs(gen_inv_det[det_pos] / float(1 << FRAC_BITS) * det_pos - 1.)
+    for row in error_table:
+        sel = (det_pos >= row['det_min']) & (det_pos <= row['det_max'])
+        dut._log.info("Octave " + str(row['octave']) + " max relative error is " + str(rel_error[sel].max()))
+        assert rel_error[sel].max() <= row['max_rel_error'] + 1e-12
+
+    dut._log.info("Finished")
+
+
+# Profile every test above when PROFILE_TESTS=1
+profile_tests(globals())
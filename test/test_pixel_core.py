@@ -9,11 +9,16 @@ import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import ClockCycles, Timer
 import numpy as np
-from shared_utils import upscale_color, Polygon, should_pixel_be_rasterized
+from shared_utils import upscale_color, Polygon, PolygonSlots, poly_fields, sweep_frame
+from raster_model import frame_to_rgb
+from golden import golden_service, make_scene
+from concurrent.futures import Future
 from PIL import Image
 from os import environ
+from profiling import profile_tests
 
 SAVED_IMAGE_PATH = 'image_artifacts/pixel_core/'
+SWEEP_PATH = 'tb_pixel_core_sweep.hex'
 
 
 # Colors mapping
@@ -33,97 +38,53 @@ class PCPolygon(Polygon):
         self.enable = enable
 
 
-def set_polygon_a(dut, poly: PCPolygon):
+# Polygon buses of the testbench, shared by every test like the registers behind them
+_slots = None
+
+
+def polygon_slots(dut) -> PolygonSlots:
     """
-    Set ploygon A rasterization params
+    Shared polygon slot bundle of the testbench
     """
+    global _slots
+    if _slots is None:
+        _slots = PolygonSlots.pixel_core(dut)
+    return _slots
 
-    # Set vertices
-    dut.v0_x_a.value = int(poly.v0[0] / 8)
-    dut.v0_y_a.value = int(poly.v0[1] / 8)
-    dut.v1_x_a.value = int(poly.v1[0] / 8)
-    dut.v1_y_a.value = int(poly.v1[1] / 8)
-    dut.v2_x_a.value = int(poly.v2[0] / 8)
-    dut.v2_y_a.value = int(poly.v2[1] / 8)
 
-    # Set color
-    dut.poly_color_a.value = poly.raw_color
+def set_polygons(dut, polys: dict):
+    """
+    Set rasterization params of {slot: polygon} in one write per bus
+    """
+    polygon_slots(dut).write({slot: (poly_fields(poly), poly.enable) for slot, poly in polys.items()})
 
-    # Enable rasterization
-    if poly.enable == True:
-        dut.en_a.value = 1
-    else:
-        dut.en_a.value = 0
+
+def set_polygon_a(dut, poly: PCPolygon):
+    """
+    Set ploygon A rasterization params
+    """
+    set_polygons(dut, {0: poly})
 
 
 def set_polygon_b(dut, poly: PCPolygon):
     """
     Set ploygon B rasterization params
     """
-
-    # Set vertices
-    dut.v0_x_b.value = int(poly.v0[0] / 8)
-    dut.v0_y_b.value = int(poly.v0[1] / 8)
-    dut.v1_x_b.value = int(poly.v1[0] / 8)
-    dut.v1_y_b.value = int(poly.v1[1] / 8)
-    dut.v2_x_b.value = int(poly.v2[0] / 8)
-    dut.v2_y_b.value = int(poly.v2[1] / 8)
-
-    # Set color
-    dut.poly_color_b.value = poly.raw_color
-
-    # Enable rasterization
-    if poly.enable == True:
-        dut.en_b.value = 1
-    else:
-        dut.en_b.value = 0
-
+    set_polygons(dut, {1: poly})
 
 
 def set_polygon_c(dut, poly: PCPolygon):
     """
     Set ploygon C rasterization params
     """
-
-    # Set vertices
-    dut.v0_x_c.value = int(poly.v0[0] / 8)
-    dut.v0_y_c.value = int(poly.v0[1] / 8)
-    dut.v1_x_c.value = int(poly.v1[0] / 8)
-    dut.v1_y_c.value = int(poly.v1[1] / 8)
-    dut.v2_x_c.value = int(poly.v2[0] / 8)
-    dut.v2_y_c.value = int(poly.v2[1] / 8)
-
-    # Set color
-    dut.poly_color_c.value = poly.raw_color
-
-    # Enable rasterization
-    if poly.enable == True:
-        dut.en_c.value = 1
-    else:
-        dut.en_c.value = 0
+    set_polygons(dut, {2: poly})
 
 
 def set_polygon_d(dut, poly: PCPolygon):
     """
-    Set ploygon C rasterization params
+    Set ploygon D rasterization params
     """
-
-    # Set vertices
-    dut.v0_x_d.value = int(poly.v0[0] / 8)
-    dut.v0_y_d.value = int(poly.v0[1] / 8)
-    dut.v1_x_d.value = int(poly.v1[0] / 8)
-    dut.v1_y_d.value = int(poly.v1[1] / 8)
-    dut.v2_x_d.value = int(poly.v2[0] / 8)
-    dut.v2_y_d.value = int(poly.v2[1] / 8)
-
-    # Set color
-    dut.poly_color_d.value = poly.raw_color
-
-    # Enable rasterization
-    if poly.enable == True:
-        dut.en_d.value = 1
-    else:
-        dut.en_d.value = 0
+    set_polygons(dut, {3: poly})
 
 
 async def reset_dut(dut):
@@ -140,9 +101,17 @@ async def reset_dut(dut):
 
 async def draw_screen(dut):
     """
-    Draw whole screen from DUT
+    Draw whole screen from DUT, swept by the testbench
+    """
+    # Expand color indices into seperate RGB channels
+    return frame_to_rgb(await sweep_frame(dut, SWEEP_PATH))
+
+
+async def draw_screen_gpi(dut) -> np.ndarray:
+    """
+    Frame of color indices driven and read pixel by pixel through the GPI, cross-checks the testbench sweep
     """
-    gen_arr = np.zeros((480, 640, 3), dtype=np.uint8)
+    gen_arr = np.zeros((480, 640), dtype=np.int64)
 
     # Loop over entire screen
     for row in range(480):
@@ -157,62 +126,18 @@ async def draw_screen(dut):
             # Wait a small amount to measure the registered output
             await Timer(1, units='ns')
 
-            # Save into seperate RGB channels
-            gen_arr[row, col, :] = upscale_color(dut.pixel_out.value.integer)
+            gen_arr[row, col] = dut.pixel_out.value.integer
 
-    # Return generated images
     return gen_arr
 
 
-def draw_screen_gt(poly_a: PCPolygon, poly_b: PCPolygon, poly_c: PCPolygon, poly_d: PCPolygon, bg_color: int):
+def draw_screen_gt(poly_a: PCPolygon, poly_b: PCPolygon, poly_c: PCPolygon, poly_d: PCPolygon, bg_color: int) -> Future:
     """
     Ground truth generation of whole screen
-    """
-    gt_arr = np.zeros((480, 640, 3), dtype=np.uint8)
 
-    # Loop over entire screen
-    for row in range(480):
-        for col in range(640):
-
-            # Check poly A
-            if (poly_a.enable):
-                a = bool(should_pixel_be_rasterized(poly_a.v0, poly_a.v1, poly_a.v2, col, row))
-            else:
-                a = False
-
-            # Check poly B
-            if (poly_b.enable):
-                b = bool(should_pixel_be_rasterized(poly_b.v0, poly_b.v1, poly_b.v2, col, row))
-            else:
-                b = False
-
-            # Check poly C
-            if (poly_c.enable):
-                c = bool(should_pixel_be_rasterized(poly_c.v0, poly_c.v1, poly_c.v2, col, row))
-            else:
-                c = False
-
-            # Check poly D
-            if (poly_d.enable):
-                d = bool(should_pixel_be_rasterized(poly_d.v0, poly_d.v1, poly_d.v2, col, row))
-            else:
-                d = False
-
-            # Find the "in front" polygon
-            if (a == True):
-                # Polygon A takes "priority"
-                gt_arr[row, col, :] = poly_a.color
-            elif (b == True):
-                gt_arr[row, col, :] = poly_b.color
-            elif (c == True):
-                gt_arr[row, col, :] = poly_c.color
-            elif (d == True):
-                gt_arr[row, col, :] = poly_d.color
-            else:
-                # Background color
-                gt_arr[row, col, :] = upscale_color(bg_color)
-
-    return gt_arr
+    Rendered by the golden frame service while the DUT draws, the future resolves to the frame of color indices
+    """
+    return golden_service().submit(make_scene([poly_a, poly_b, poly_c, poly_d], bg_color))
 
 
 @cocotb.test()
@@ -271,16 +196,14 @@ async def test_multi_polygons(dut):
                 color=COLOR_RED + COLOR_GREEN,
                 enable=True)
 
-    # Generate ground truth
-    gt_arr = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_BLACK)
+    # Start ground truth generation
+    gt_future = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_BLACK)
 
     # Run DUT
     dut.background_color.value = COLOR_BLACK
-    set_polygon_a(dut, p_a)
-    set_polygon_b(dut, p_b)
-    set_polygon_c(dut, p_c)
-    set_polygon_d(dut, p_d)
+    set_polygons(dut, {0: p_a, 1: p_b, 2: p_c, 3: p_d})
     gen_arr = await draw_screen(dut)
+    gt_arr = frame_to_rgb(gt_future.result())
 
     if environ['SAVE_IMGS'] == 'True':
         gt_img = Image.fromarray(gt_arr, mode='RGB')
@@ -336,16 +259,14 @@ async def test_empty_screen(dut):
                 color=COLOR_RED + COLOR_GREEN,
                 enable=False)
 
-    # Generate ground truth
-    gt_arr = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_RED)
+    # Start ground truth generation
+    gt_future = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_RED)
 
     # Run DUT
     dut.background_color.value = COLOR_RED
-    set_polygon_a(dut, p_a)
-    set_polygon_b(dut, p_b)
-    set_polygon_c(dut, p_c)
-    set_polygon_d(dut, p_d)
+    set_polygons(dut, {0: p_a, 1: p_b, 2: p_c, 3: p_d})
     gen_arr = await draw_screen(dut)
+    gt_arr = frame_to_rgb(gt_future.result())
 
     if environ['SAVE_IMGS'] == 'True':
         gt_img = Image.fromarray(gt_arr, mode='RGB')
@@ -401,16 +322,14 @@ async def test_polygon_a(dut):
                 color=COLOR_RED + COLOR_GREEN,
                 enable=False)
 
-    # Generate ground truth
-    gt_arr = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_BLACK)
+    # Start ground truth generation
+    gt_future = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_BLACK)
 
     # Run DUT
     dut.background_color.value = COLOR_BLACK
-    set_polygon_a(dut, p_a)
-    set_polygon_b(dut, p_b)
-    set_polygon_c(dut, p_c)
-    set_polygon_d(dut, p_d)
+    set_polygons(dut, {0: p_a, 1: p_b, 2: p_c, 3: p_d})
     gen_arr = await draw_screen(dut)
+    gt_arr = frame_to_rgb(gt_future.result())
 
     if environ['SAVE_IMGS'] == 'True':
         gt_img = Image.fromarray(gt_arr, mode='RGB')
@@ -466,16 +385,14 @@ async def test_polygon_b(dut):
                 color=COLOR_RED + COLOR_GREEN,
                 enable=False)
 
-    # Generate ground truth
-    gt_arr = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_BLACK)
+    # Start ground truth generation
+    gt_future = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_BLACK)
 
     # Run DUT
     dut.background_color.value = COLOR_BLACK
-    set_polygon_a(dut, p_a)
-    set_polygon_b(dut, p_b)
-    set_polygon_c(dut, p_c)
-    set_polygon_d(dut, p_d)
+    set_polygons(dut, {0: p_a, 1: p_b, 2: p_c, 3: p_d})
     gen_arr = await draw_screen(dut)
+    gt_arr = frame_to_rgb(gt_future.result())
 
     if environ['SAVE_IMGS'] == 'True':
         gt_img = Image.fromarray(gt_arr, mode='RGB')
@@ -531,16 +448,14 @@ async def test_polygon_c(dut):
                 color=COLOR_RED + COLOR_GREEN,
                 enable=False)
 
-    # Generate ground truth
-    gt_arr = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_BLACK)
+    # Start ground truth generation
+    gt_future = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_BLACK)
 
     # Run DUT
     dut.background_color.value = COLOR_BLACK
-    set_polygon_a(dut, p_a)
-    set_polygon_b(dut, p_b)
-    set_polygon_c(dut, p_c)
-    set_polygon_d(dut, p_d)
+    set_polygons(dut, {0: p_a, 1: p_b, 2: p_c, 3: p_d})
     gen_arr = await draw_screen(dut)
+    gt_arr = frame_to_rgb(gt_future.result())
 
     if environ['SAVE_IMGS'] == 'True':
         gt_img = Image.fromarray(gt_arr, mode='RGB')
@@ -596,16 +511,14 @@ async def test_polygon_d(dut):
                 color=COLOR_RED + COLOR_GREEN,
                 enable=True)
 
-    # Generate ground truth
-    gt_arr = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_BLACK)
+    # Start ground truth generation
+    gt_future = draw_screen_gt(p_a, p_b, p_c, p_d, COLOR_BLACK)
 
     # Run DUT
     dut.background_color.value = COLOR_BLACK
-    set_polygon_a(dut, p_a)
-    set_polygon_b(dut, p_b)
-    set_polygon_c(dut, p_c)
-    set_polygon_d(dut, p_d)
+    set_polygons(dut, {0: p_a, 1: p_b, 2: p_c, 3: p_d})
     gen_arr = await draw_screen(dut)
+    gt_arr = frame_to_rgb(gt_future.result())
 
     if environ['SAVE_IMGS'] == 'True':
         gt_img = Image.fromarray(gt_arr, mode='RGB')
@@ -622,3 +535,40 @@ async def test_polygon_d(dut):
 
     dut._log.info("Finished")
 
+
+@cocotb.test()
+async def test_sweep_matches_gpi(dut):
+    """
+    Test the testbench sweep against the same frame driven pixel by pixel from Python
+    """
+    dut._log.info("Start")
+
+    clock = Clock(dut.clk, 40, units="ns")
+    cocotb.start_soon(clock.start())
+
+    # Reset
+    await reset_dut(dut)
+
+    # Overlapping polygons in every slot
+    dut.background_color.value = COLOR_BLUE
+    set_polygons(dut, {0: PCPolygon(v0=np.array([600, 200]), v1=np.array([440, 410]), v2=np.array([0, 0]),
+                                    color=COLOR_RED, enable=True),
+                       1: PCPolygon(v0=np.array([640, 0]), v1=np.array([0, 480]), v2=np.array([0, 0]),
+                                    color=COLOR_GREEN, enable=True),
+                       2: PCPolygon(v0=np.array([640, 400]), v1=np.array([300, 480]), v2=np.array([100, 0]),
+                                    color=COLOR_BLACK, enable=True),
+                       3: PCPolygon(v0=np.array([624, 400]), v1=np.array([616, 488]), v2=np.array([616, 400]),
+                                    color=COLOR_RED + COLOR_GREEN, enable=True)})
+
+    swept = await sweep_frame(dut, SWEEP_PATH)
+    driven = await draw_screen_gpi(dut)
+
+    mismatches = np.count_nonzero(swept != driven)
+    dut._log.info("Sweep mismatches: " + str(mismatches))
+    assert mismatches == 0
+
+    dut._log.info("Finished")
+
+
+# Profile every test above when PROFILE_TESTS=1
+profile_tests(globals())
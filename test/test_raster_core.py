@@ -12,9 +12,13 @@ from cocotb.triggers import Timer
 import numpy as np
 from matplotlib import pyplot as plt
 from os import environ
-from shared_utils import should_pixel_be_rasterized
+from raster_model import rasterize_frame
+from shared_utils import Polygon, sweep_frame
+from golden import golden_service, make_scene
+from profiling import profile_tests
 
 SAVED_IMAGE_PATH = 'image_artifacts/rasterization/'
+SWEEP_PATH = 'tb_raster_core_sweep.hex'
 
 
 def print_internal_state(dut):
@@ -46,6 +50,19 @@ def set_polygon(dut, v0, v1, v2):
     dut.v2_y.value = int(v2[1] / 8)
 
 
+def check_hw_model(dut, v0, v1, v2, gen_arr):
+    """
+    Check generated frame against the bit exact hardware model, no mismatches are allowed
+
+    The model frame is a single slot scene of color 1 over color 0, fetched through the golden frame store
+    """
+    golden = golden_service()
+    hw_arr = golden.submit(make_scene([Polygon(v0=v0, v1=v1, v2=v2, color=1)], 0)).result() == 1
+    mismatches = np.count_nonzero(hw_arr != gen_arr)
+    dut._log.info("Hardware model mismatches: " + str(mismatches) + ", " + str(golden.store))
+    assert mismatches == 0
+
+
 async def draw_polygon_on_screen(dut, v0, v1, v2):
     """
     Draw a polygon on screen, check against ground truth algorithm
@@ -53,25 +70,34 @@ async def draw_polygon_on_screen(dut, v0, v1, v2):
 
     set_polygon(dut, v0, v1, v2)
 
-    gt_arr = np.zeros((480, 640))
-    gen_arr = np.zeros((480, 640))
+    # Generate ground truth for the whole frame at once
+    gt_arr = rasterize_frame(v0, v1, v2).astype(float)
+
+    # Sweep the entire screen in the testbench
+    gen_arr = (await sweep_frame(dut, SWEEP_PATH)).astype(float)
+
+    # Return generated images
+    return (gt_arr, gen_arr)
+
+
+async def draw_screen_gpi(dut) -> np.ndarray:
+    """
+    Rasterize output driven and read pixel by pixel through the GPI, cross-checks the testbench sweep
+    """
+    gen_arr = np.zeros((480, 640), dtype=np.int64)
 
     # Loop over entire screen
     for row in range(480):
         for col in range(640):
-            # Generate ground truth
-            gt_arr[row, col] = should_pixel_be_rasterized(v0, v1, v2, col, row)
-
             # Get rasterizer output
             dut.pixel_col.value = col
             dut.pixel_row.value = row
 
             await Timer(40, units="ns")
 
-            gen_arr[row, col] = dut.rasterize.value
+            gen_arr[row, col] = dut.rasterize.value.integer
 
-    # Return generated images
-    return (gt_arr, gen_arr)
+    return gen_arr
 
 
 @cocotb.test()
@@ -98,6 +124,9 @@ async def test_whole_screen(dut):
     if error > 0.01:
         assert 1 == 0
 
+    # Generated rasterization should exactly match the hardware model
+    check_hw_model(dut, v0, v1, v2, gen_arr)
+
     # Save rasterized images if desired
     if environ['SAVE_IMGS'] == 'True':
         plt.imsave(SAVED_IMAGE_PATH + 'gt_whole_screen.png', gt_arr)
@@ -131,6 +160,9 @@ async def test_corner_top_left(dut):
     if error > 0.01:
         assert 1 == 0
 
+    # Generated rasterization should exactly match the hardware model
+    check_hw_model(dut, v0, v1, v2, gen_arr)
+
     # Save rasterized images if desired
     if environ['SAVE_IMGS'] == 'True':
         plt.imsave(SAVED_IMAGE_PATH + 'gt_top_left_screen.png', gt_arr)
@@ -164,6 +196,9 @@ async def test_corner_top_right(dut):
     if error > 0.01:
         assert 1 == 0
 
+    # Generated rasterization should exactly match the hardware model
+    check_hw_model(dut, v0, v1, v2, gen_arr)
+
     # Save rasterized images if desired
     if environ['SAVE_IMGS'] == 'True':
         plt.imsave(SAVED_IMAGE_PATH + 'gt_top_right_screen.png', gt_arr)
@@ -197,6 +232,9 @@ async def test_corner_bottom_right(dut):
     if error > 0.01:
         assert 1 == 0
 
+    # Generated rasterization should exactly match the hardware model
+    check_hw_model(dut, v0, v1, v2, gen_arr)
+
     # Save rasterized images if desired
     if environ['SAVE_IMGS'] == 'True':
         plt.imsave(SAVED_IMAGE_PATH + 'gt_bottom_right_screen.png', gt_arr)
@@ -230,9 +268,39 @@ async def test_corner_bottom_left(dut):
     if error > 0.01:
         assert 1 == 0
 
+    # Generated rasterization should exactly match the hardware model
+    check_hw_model(dut, v0, v1, v2, gen_arr)
+
     # Save rasterized images if desired
     if environ['SAVE_IMGS'] == 'True':
         plt.imsave(SAVED_IMAGE_PATH + 'gt_bottom_left_screen.png', gt_arr)
         plt.imsave(SAVED_IMAGE_PATH + 'gen_bottom_left_screen.png', gen_arr)
 
     dut._log.info("Finished")
+
+
+@cocotb.test()
+async def test_sweep_matches_gpi(dut):
+    """
+    Test the testbench sweep against the same frame driven pixel by pixel from Python
+    """
+    dut._log.info("Start")
+
+    # Reset input address
+    dut.pixel_col.value = 0
+    dut.pixel_row.value = 0
+
+    set_polygon(dut, [600, 200], [446, 412], [1, 1])
+
+    swept = await sweep_frame(dut, SWEEP_PATH)
+    driven = await draw_screen_gpi(dut)
+
+    mismatches = np.count_nonzero(swept != driven)
+    dut._log.info("Sweep mismatches: " + str(mismatches))
+    assert mismatches == 0
+
+    dut._log.info("Finished")
+
+
+# Profile every test above when PROFILE_TESTS=1
+profile_tests(globals())
@@ -11,12 +11,16 @@ import cocotb.binary
 from cocotb.triggers import Timer
 import numpy as np
 from matplotlib import pyplot as plt
-from fxpmath import Fxp
+from shared_utils import sweep_frame
+from ray_tracer_model import depth_frame, depth_frame_hw, polygon_determinant, inverse_determinant, \
+                             approx_inverse_determinant, approx_depth_error, NO_INTERSECTION_DEPTH
+from profiling import profile_tests
 
 # Enable saving sample images for visual inspection
 # Should be turned off for CI
 SAVE_IMAGE_OUTPUT = 0
 SAVED_IMAGE_PATH = 'image_artifacts/ray_trace/'
+SWEEP_PATH = 'tb_ray_tracer_core_sweep.hex'
 
 
 def print_internal_state(dut):
@@ -149,9 +153,11 @@ def get_gt_depth(px, py, v0, v1, v2, log=False):
     return round(t), True
 
 
-def set_polygon(dut, v0, v1, v2):
+def set_polygon(dut, v0, v1, v2, inv_det: int = None):
     """
     Set current ploygon for rasterization
+
+    inv_det defaults to the exact inverse of the determinant
     """
 
     dut.vertex_0_x.value = int(v0[0])
@@ -168,42 +174,59 @@ def set_polygon(dut, v0, v1, v2):
 
     # Inverse determinant needs to be set specifically by TB as its a floating point division
     # TODO: Figure out how to handle this on the testbench side
-    det = ((v1[0] - v0[0]) * (v2[1] - v0[1])) + ((v1[1] - v0[1]) * -(v2[0] - v0[0]))
+    det = polygon_determinant(v0, v1, v2)
     dut.determinant.value = cocotb.binary.BinaryValue(int(det), n_bits=23, bigEndian=False)
 
-    inv_det = 1/det
-    inv_det_converted = Fxp(inv_det, signed=False, n_word=46, n_frac=23)
-
-    dut.inv_det.value = cocotb.binary.BinaryValue(inv_det_converted.bin(), 46)
+    # Unsigned Q23.23
+    dut.inv_det.value = inverse_determinant(det) if inv_det is None else inv_det
 
 
-async def draw_polygon_on_screen(dut, v0, v1, v2):
+async def draw_screen_gpi(dut) -> np.ndarray:
     """
-    Draw a polygon on screen, check against ground truth algorithm
+    Records {rasterize, z_actual} driven and read pixel by pixel through the GPI, cross-checks the testbench sweep
     """
-
-    set_polygon(dut, v0, v1, v2)
-
-    gt_arr = np.zeros((480, 640))
-    gen_arr = np.zeros((480, 640))
+    records = np.zeros((480, 640), dtype=np.int64)
 
     # Loop over entire screen
     for row in range(480):
         for col in range(640):
-            # Generate ground truth
-            gt_arr[row, col], r = get_gt_depth(col, row, v0, v1, v2)
-
             # Get rasterizer output
             dut.pixel_col.value = col
             dut.pixel_row.value = row
 
             await Timer(40, units="ns")
 
-            # Only set output value if device detects raterization
+            # z_actual is only defined while rasterizing
             if dut.rasterize.value == 1:
-                gen_arr[row, col] = -1 * int(dut.z_actual.value.integer)
-            else:
-                gen_arr[row, col] = -7.
+                records[row, col] = (1 << 3) | dut.z_actual.value.integer
+
+    return records
+
+
+async def draw_polygon_on_screen(dut, v0, v1, v2, inv_det: int = None):
+    """
+    Draw a polygon on screen, check against ground truth algorithm
+
+    The generated frame must match the bit exact model of the core, no mismatches are allowed
+    """
+
+    set_polygon(dut, v0, v1, v2, inv_det=inv_det)
+
+    # Generate ground truth for the whole frame at once
+    gt_arr, _ = depth_frame(v0, v1, v2)
+
+    # Sweep the entire screen in the testbench, records are {rasterize, z_actual}
+    records = await sweep_frame(dut, SWEEP_PATH)
+
+    # Only set output value if device detects raterization
+    gen_arr = np.where((records >> 3) & 1 == 1, -(records & 7), NO_INTERSECTION_DEPTH)
+
+    # Compare against the fixed point model of the core
+    z_hw, rasterize_hw = depth_frame_hw(v0, v1, v2, inv_det=inv_det)
+    hw_arr = np.where(rasterize_hw, -z_hw, NO_INTERSECTION_DEPTH)
+    mismatches = np.count_nonzero(hw_arr != gen_arr)
+    dut._log.info("Fixed point model mismatches: " + str(mismatches))
+    assert mismatches == 0
 
     # Return generated images
     return (gt_arr, gen_arr)
@@ -396,3 +419,64 @@ async def test_corner_bottom_left(dut):
     assert gen_arr[v2[1], v2[0]] == -v2[2]
 
     dut._log.info("Passed")
+
+
+@cocotb.test()
+async def test_approximate_inverse(dut):
+    """
+    Test a small triangle with the inverse determinant computed by the inverse module rather than the testbench
+    """
+
+    dut._log.info("Start")
+
+    # Reset input address
+    dut.pixel_col.value = 0
+    dut.pixel_row.value = 0
+
+    # Determinant must fit the 12 bit input of the inverse module. A determinant of 1 sits in the octave with the
+    # largest table error, so the bound below is several depth LSBs rather than a fraction of one
+    v0 = np.array([100, 100, 0])
+    v1 = np.array([101, 100, 3])
+    v2 = np.array([100, 101, 6])
+    inv_det = approx_inverse_determinant(polygon_determinant(v0, v1, v2))
+
+    gt_arr, gen_arr = await draw_polygon_on_screen(dut, v0, v1, v2, inv_det=inv_det)
+
+    # Depth may move by the bound from the persisted inverse error table, plus one for rounding
+    bound = approx_depth_error(v0, v1, v2)
+    hit = (gt_arr != NO_INTERSECTION_DEPTH) & (gen_arr != NO_INTERSECTION_DEPTH)
+    error = np.abs(gt_arr - gen_arr)[hit].max()
+    dut._log.info("test_approximate_inverse max depth error is " + str(error) + ", bound " + str(bound))
+    assert bound >= 1
+    assert error <= bound + 1
+
+    dut._log.info("Passed")
+
+
+@cocotb.test()
+async def test_sweep_matches_gpi(dut):
+    """
+    Test the testbench sweep against the same frame driven pixel by pixel from Python
+    """
+    dut._log.info("Start")
+
+    # Reset input address
+    dut.pixel_col.value = 0
+    dut.pixel_row.value = 0
+
+    set_polygon(dut, np.array([600, 200, 0]), np.array([446, 412, 7]), np.array([1, 1, 4]))
+
+    swept = await sweep_frame(dut, SWEEP_PATH)
+    driven = await draw_screen_gpi(dut)
+
+    # Depth is only compared where the sweep recorded a hit
+    swept = np.where((swept >> 3) & 1 == 1, swept, 0)
+    mismatches = np.count_nonzero(swept != driven)
+    dut._log.info("Sweep mismatches: " + str(mismatches))
+    assert mismatches == 0
+
+    dut._log.info("Finished")
+
+
+# Profile every test above when PROFILE_TESTS=1
+profile_tests(globals())
@@ -8,155 +8,246 @@ Top level testbench
 import cocotb
 from cocotb.clock import Clock, Timer
 from cocotb.triggers import ClockCycles, RisingEdge, FallingEdge
+from cocotb.utils import get_sim_time
 import shared_utils as shared
-from shared_utils import SPIcmd, send_spi_cmd, Polygon, upscale_color_from_components, should_pixel_be_rasterized, \
-                                        upscale_color, COLOR_RED, COLOR_GREEN, COLOR_BLUE, SPI_CMD_WRITE_POLY_A, \
+from shared_utils import SPIcmd, SPIMaster, Polygon, \
+                                        upscale_color, COLOR_BLACK, COLOR_RED, COLOR_GREEN, COLOR_BLUE, SPI_CMD_WRITE_POLY_A, \
                                         SPI_CMD_WRITE_POLY_B, SPI_CMD_CLEAR_POLY_A, SPI_CMD_CLEAR_POLY_B, SPI_CMD_WRITE_POLY_C, SPI_CMD_CLEAR_POLY_C, \
-                                        SPI_CMD_CLEAR_POLY_D, SPI_CMD_WRITE_POLY_D
+                                        SPI_CMD_CLEAR_POLY_D, SPI_CMD_WRITE_POLY_D, SPI_CMD_SET_BG_COLOR
 import numpy as np
+import random
+from raster_model import frame_to_rgb, FRAME_WIDTH, FRAME_HEIGHT
+from golden import golden_service, make_scene
+from command_stream import SPI_CMD_FIELDS, CommandStreamReader, CommandStreamWriter, make_cmds
+from frame_capture import FrameCapture, CAPTURE_PATH, FRAME_CYCLES, pack_record, visible_frame, sync_errors
 from PIL import Image
 from os import environ
+from profiling import profile_tests
 
 SAVED_IMAGE_PATH = 'image_artifacts/top_level/'
 VISIBLE_N_CYCLES = 800*480
 SCREEN_N_CYCLES = 800*525
+SCREEN_WIDTH = 800
+
+# 25MHz pixel clock, outputs are sampled just before the next rising edge
+CLOCK_PERIOD = 40
+SAMPLE_DELAY = 19
+
+# Records kept when outputs are sampled through the GPI, a whole frame plus the sample that completes it
+SAMPLE_RING_CYCLES = FRAME_CYCLES + 1
+
+# Command file of the SPI master BFM, see tb_top.v
+SPI_CMD_PATH = 'tb_top_spi.hex'
+
+# Command stream written by test_replay_stream unless one is given with +cmd_stream
+REPLAY_STREAM_PATH = 'tb_top_stream.cmds'
+REPLAY_FRAMES = 4
+
+# Read frames back from the testbench capture file instead of sampling outputs every cycle, both paths are compared by
+# test_capture_matches_sampling
+CAPTURE_FRAMES = environ.get('CAPTURE_FRAMES', 'True') == 'True'
+
+# Debug fallback that also samples the outputs through the GPI, waking Python on every cycle. It is always used without
+# capture, with both every checked record is compared between them
+SAMPLE_OUTPUTS = environ.get('SAMPLE_OUTPUTS', 'False') == 'True'
 
 
 
 class VGAScreen:
     """
     Class handles internal state of VGA screen through tests
+
+    The clock runs natively in the simulator, a monitor collects outputs and checks whole frames as they complete.
+    Screen position is derived from simulation time, counted from the first clock edge out of reset
     """
-    def __init__(self, dut, clk_signal):
-
-        # Create VGA screen mock with 3 color channels
-        self.screen_buf = np.zeros((525, 800, 3), dtype=np.uint8)
-        self.gt_buf = np.zeros((525, 800, 3), dtype=np.uint8)
-        self.background_color = np.array([0, 0, 0]) # Black bg to start
-        self.pos_x = 0
-        self.pos_y = 0
+    def __init__(self, dut, clk_signal, capture: bool = CAPTURE_FRAMES, sample: bool = SAMPLE_OUTPUTS):
+
+        # Create VGA screen mock over the visible region, pixels are 6 bit color indices
+        self.screen_buf = np.zeros((FRAME_HEIGHT, FRAME_WIDTH), dtype=np.uint8)
+        self.gt_buf = np.zeros((FRAME_HEIGHT, FRAME_WIDTH), dtype=np.uint8)
+        self.background_color = COLOR_BLACK # Black bg to start
         self.poly_a = None
         self.poly_b = None
         self.poly_c = None
         self.poly_d = None
         self.dut = dut
         self.clk_signal = clk_signal
+        self.clock_task = None
         self.has_been_reset = False
 
+        # Commands are clocked out by the SPI master BFM in the testbench
+        self.spi = SPIMaster(dut.spi_bfm, cocotb.plusargs.get('spi_file', SPI_CMD_PATH))
+
+        # Time of the first rising edge out of reset, None until the monitor sees it
+        self.start_time = None
+
+        # Ground truth is rendered by the golden frame service while the simulation runs, a snapshot of the
+        # committed scene is taken as each frame starts and evaluated in bulk once it completes
+        self.golden = golden_service()
+        self.gt_future = None
+        self.frame_gt_future = None
+        self.frame_count = 0
+        self.commit_scene()
+
+        # Outputs are streamed to a capture file by the testbench, which is opened again on reset. The GPI sampler
+        # records every cycle into a ring of records in the same format
+        self.checked_records = 0
+        self.capture = None
+        self.sampled = None
+        if capture == True:
+            self.capture = FrameCapture(cocotb.plusargs.get('capture_file', CAPTURE_PATH))
+            self.dut.capture_en.value = 0
+        if sample == True or capture == False:
+            # A frame is checked once the cycle after it has been sampled, so the ring holds one extra record
+            self.sampled = np.zeros(SAMPLE_RING_CYCLES, dtype=np.uint32)
+
+    @property
+    def position(self) -> int:
+        """
+        Linear screen position of the last sampled cycle since reset
+        """
+        if self.start_time is None:
+            return 0
+        return max(int((get_sim_time(units='ns') - self.start_time - SAMPLE_DELAY) // CLOCK_PERIOD), 0)
+
+    @property
+    def pos_x(self) -> int:
+        return self.position % SCREEN_WIDTH
+
+    @property
+    def pos_y(self) -> int:
+        return (self.position % FRAME_CYCLES) // SCREEN_WIDTH
+
+    def commit_scene(self):
+        """
+        Hand the currently stored polygons to the golden frame service
+        """
+        scene = make_scene([self.poly_a, self.poly_b, self.poly_c, self.poly_d], self.background_color)
+        self.gt_future = self.golden.submit(scene)
+
+    def start_capture(self):
+        """
+        Start a fresh capture file, records count from the next reset release
+        """
+        if self.capture is not None:
+            self.dut.capture_en.value = 1
+
+    async def flush_capture(self):
+        """
+        Have the testbench flush every record written so far, toggling capture_flush flushes the file
+        """
+        self.dut.capture_flush.value = 1 - self.dut.capture_flush.value.integer
+        await Timer(1, units='ns')
+
+    def records(self, first: int, last: int) -> np.ndarray:
+        """
+        Records of screen positions [first, last)
+        """
+        if self.capture is None:
+            return self.sampled[np.arange(first, last) % SAMPLE_RING_CYCLES]
+
+        records = self.capture.records(first, last)
+        if self.sampled is not None:
+            mismatches = np.count_nonzero(records != self.sampled[np.arange(first, last) % SAMPLE_RING_CYCLES])
+            assert mismatches == 0, str(mismatches) + " captured records differ from the GPI samples"
+        return records
+
+    def complete_frame(self, index: int):
+        """
+        Check the frame that just finished drawing
+
+        Sync signals are checked for everything since the last check, then the visible region and its ground truth
+        are filled in for the checkers
+        """
+        frame_start = index * FRAME_CYCLES
+        last = frame_start + VISIBLE_N_CYCLES
+        records = self.records(self.checked_records, last)
+
+        # Check HSYNC, VSYNC and INT
+        errors = sync_errors(records, self.checked_records)
+        assert errors == {'hsync': 0, 'vsync': 0, 'int_out': 0}, "Sync errors " + str(errors)
+
+        np.copyto(self.screen_buf, visible_frame(records[frame_start - self.checked_records:]))
+        self.checked_records = last
+
+        np.copyto(self.gt_buf, self.frame_gt_future.result())
+        self.frame_gt_future = None
+        self.frame_count += 1
+
+    async def check_remaining(self):
+        """
+        Check sync signals of every cycle recorded since the last completed frame
+        """
+        if self.start_time is None:
+            return
+
+        if self.capture is not None:
+            # Stopping the capture flushes the file
+            self.dut.capture_en.value = 0
+            await Timer(1, units='ns')
+            last = len(self.capture)
+            if self.sampled is not None:
+                # Only compare cycles the sampler has certainly reached
+                last = min(last, self.position)
+        else:
+            last = self.position + 1
+
+        records = self.records(self.checked_records, last)
+        errors = sync_errors(records, self.checked_records)
+        assert errors == {'hsync': 0, 'vsync': 0, 'int_out': 0}, "Sync errors " + str(errors)
+        self.checked_records = last
+
+    def sample_outputs(self, position: int):
+        """
+        Record the outputs of the current cycle through the GPI
+        """
+        self.sampled[position % SAMPLE_RING_CYCLES] = sample_record(self.dut)
+
+    async def wait_position(self, position: int):
+        """
+        Wait until the outputs of a screen position can be sampled
+        """
+        target = self.start_time + SAMPLE_DELAY + position * CLOCK_PERIOD
+        now = get_sim_time(units='ns')
+        if target > now:
+            await Timer(target - now, units='ns')
+
     async def clock(self):
         """
-        Clock the VGA screen and check hsync and vsync
+        Clock the VGA screen and monitor its outputs
         """
-        while True:
-            # Clock testbench
-            self.clk_signal.value = 0
-
-            await Timer(20, units='ns')
-
-            self.clk_signal.value = 1
-
-            # Little hack here, if we split this time up a little bit it guarantees we run the code below when using even 40ns clock period
-            await Timer(19, units='ns')
-
-            # Only assert after master reset since gate level simulation will have undefined value
-            if self.has_been_reset == True:
-
-                # Update internal position counter
-                self.pos_x += 1
-                if self.pos_x == 800:
-                    self.pos_x = 0
-                    self.pos_y += 1
-
-                if self.pos_y == 525:
-                    self.pos_y = 0
-
-                # Check HSYNC signal
-                if self.pos_x >= 656 and self.pos_x <= 751:
-                    assert self.dut.hsync.value == 0
-                    pass
-                else:
-                    assert self.dut.hsync.value == 1
-
-                # Check VSYNC signal
-                if self.pos_y == 490 or self.pos_y == 491:
-                    assert self.dut.vsync.value == 0
-                else:
-                    assert self.dut.vsync.value == 1
-
-                # Check INT pin
-                if self.pos_y >= 480:
-                    assert self.dut.int_out.value == 1
-                else:
-                    assert self.dut.int_out.value == 0
-
-                # Write output into screen buffer
-                self.screen_buf[self.pos_y, self.pos_x, :] = upscale_color_from_components(c_red=self.dut.red_out.value,
-                                                                                            c_green=self.dut.green_out.value,
-                                                                                            c_blue=self.dut.blue_out.value)
-
-                # Generate out "Ground truth" buffer value (if applicable)
-                if self.pos_x < 640 and self.pos_y < 480:
-                    # Rasterize poly_a if required
-                    if self.poly_a != None:
-                        a = bool(should_pixel_be_rasterized(v0=self.poly_a.v0,
-                                                        v1=self.poly_a.v1,
-                                                        v2=self.poly_a.v2,
-                                                        p_x=self.pos_x,
-                                                        p_y=self.pos_y))
-                    else:
-                        a = False
-
-                    # Rasterize poly_b if required
-                    if self.poly_b != None:
-                        b = bool(should_pixel_be_rasterized(v0=self.poly_b.v0,
-                                                        v1=self.poly_b.v1,
-                                                        v2=self.poly_b.v2,
-                                                        p_x=self.pos_x,
-                                                        p_y=self.pos_y))
-                    else:
-                        b = False
-
-                    # Rasterize poly_c if required
-                    if self.poly_c != None:
-                        c = bool(should_pixel_be_rasterized(v0=self.poly_c.v0,
-                                                        v1=self.poly_c.v1,
-                                                        v2=self.poly_c.v2,
-                                                        p_x=self.pos_x,
-                                                        p_y=self.pos_y))
-                    else:
-                        c = False
-
-                    # Rasterize poly_d if required
-                    if self.poly_d != None:
-                        d = bool(should_pixel_be_rasterized(v0=self.poly_d.v0,
-                                                        v1=self.poly_d.v1,
-                                                        v2=self.poly_d.v2,
-                                                        p_x=self.pos_x,
-                                                        p_y=self.pos_y))
-                    else:
-                        d = False
-
-                    # Find the "in front" polygon
-                    if (a == True):
-                        # Polygon A takes "priority"
-                        self.gt_buf[self.pos_y, self.pos_x, :] = self.poly_a.color
-                    elif (b == True):
-                        self.gt_buf[self.pos_y, self.pos_x, :] = self.poly_b.color
-                    elif (c == True):
-                        self.gt_buf[self.pos_y, self.pos_x, :] = self.poly_c.color
-                    elif (d == True):
-                        self.gt_buf[self.pos_y, self.pos_x, :] = self.poly_d.color
-                    else:
-                        # Background color
-                        self.gt_buf[self.pos_y, self.pos_x, :] = self.background_color
+        clock = Clock(self.clk_signal, CLOCK_PERIOD, units='ns')
+        self.clock_task = cocotb.start_soon(clock.start(start_high=False))
 
+        # Only monitor after master reset since gate level simulation will have undefined value
+        await RisingEdge(self.dut.rst_n)
+        await RisingEdge(self.clk_signal)
+        self.start_time = get_sim_time(units='ns')
+
+        index = 0
+        while True:
+            frame_start = index * FRAME_CYCLES
+
+            # Snapshot the committed scene for this frame
+            await self.wait_position(frame_start)
+            self.frame_gt_future = self.gt_future
+
+            # The GPI sampler wakes on every cycle of the frame, otherwise the monitor only wakes at frame boundaries
+            if self.sampled is not None:
+                for position in range(frame_start, frame_start + FRAME_CYCLES):
+                    await self.wait_position(position)
+                    self.sample_outputs(position)
+                    if position == frame_start + VISIBLE_N_CYCLES:
+                        if self.capture is not None:
+                            await self.flush_capture()
+                        self.complete_frame(index)
             else:
-                # Reset internal counter
-                self.pos_y = 0
-                self.pos_x = 0
+                # Records of the visible region are on disk once the capture is flushed
+                await self.wait_position(frame_start + VISIBLE_N_CYCLES)
+                await self.flush_capture()
+                self.complete_frame(index)
 
-            # Round the clock cycle to 40ns
-            await Timer(1, units='ns')
+            index += 1
 
 
     async def set_poly_a(self, poly: Polygon, save_poly=True):
@@ -166,10 +257,11 @@ class VGAScreen:
 
         if save_poly == True:
             self.poly_a = poly
+            self.commit_scene()
 
         # Generate and send command
         new_cmd = SPIcmd.from_poly(poly=poly, cmd=SPI_CMD_WRITE_POLY_A)
-        await send_spi_cmd(cs_signal=self.dut.spi_cs, sck_signal=self.dut.spi_sck, mosi_signal=self.dut.spi_mosi, cmd=new_cmd)
+        await self.spi.send([new_cmd])
 
 
 
@@ -180,10 +272,11 @@ class VGAScreen:
 
         if save_poly == True:
             self.poly_b = poly
+            self.commit_scene()
 
         # Generate and send command
         new_cmd = SPIcmd.from_poly(poly=poly, cmd=SPI_CMD_WRITE_POLY_B)
-        await send_spi_cmd(cs_signal=self.dut.spi_cs, sck_signal=self.dut.spi_sck, mosi_signal=self.dut.spi_mosi, cmd=new_cmd)
+        await self.spi.send([new_cmd])
 
 
     async def set_poly_c(self, poly: Polygon, save_poly=True):
@@ -193,10 +286,11 @@ class VGAScreen:
 
         if save_poly == True:
             self.poly_c = poly
+            self.commit_scene()
 
         # Generate and send command
         new_cmd = SPIcmd.from_poly(poly=poly, cmd=SPI_CMD_WRITE_POLY_C)
-        await send_spi_cmd(cs_signal=self.dut.spi_cs, sck_signal=self.dut.spi_sck, mosi_signal=self.dut.spi_mosi, cmd=new_cmd)
+        await self.spi.send([new_cmd])
 
 
     async def set_poly_d(self, poly: Polygon, save_poly=True):
@@ -206,10 +300,11 @@ class VGAScreen:
 
         if save_poly == True:
             self.poly_d = poly
+            self.commit_scene()
 
         # Generate and send command
         new_cmd = SPIcmd.from_poly(poly=poly, cmd=SPI_CMD_WRITE_POLY_D)
-        await send_spi_cmd(cs_signal=self.dut.spi_cs, sck_signal=self.dut.spi_sck, mosi_signal=self.dut.spi_mosi, cmd=new_cmd)
+        await self.spi.send([new_cmd])
 
 
     async def clear_poly_a(self):
@@ -219,10 +314,11 @@ class VGAScreen:
         Note: This will fail if not sent during the vsync period!
         """
         self.poly_a = None
+        self.commit_scene()
 
         # Generate and send command
         new_cmd = SPIcmd(cmd=SPI_CMD_CLEAR_POLY_A, color=0, v0_x=0, v1_x=0, v2_x=0, v0_y=0, v1_y=0, v2_y=0)
-        await send_spi_cmd(cs_signal=self.dut.spi_cs, sck_signal=self.dut.spi_sck, mosi_signal=self.dut.spi_mosi, cmd=new_cmd)
+        await self.spi.send([new_cmd])
 
 
     async def clear_poly_b(self):
@@ -232,10 +328,11 @@ class VGAScreen:
         Note: This will fail if not sent during the vsync period!
         """
         self.poly_b = None
+        self.commit_scene()
 
         # Generate and send command
         new_cmd = SPIcmd(cmd=SPI_CMD_CLEAR_POLY_B, color=0, v0_x=0, v1_x=0, v2_x=0, v0_y=0, v1_y=0, v2_y=0)
-        await send_spi_cmd(cs_signal=self.dut.spi_cs, sck_signal=self.dut.spi_sck, mosi_signal=self.dut.spi_mosi, cmd=new_cmd)
+        await self.spi.send([new_cmd])
 
 
     async def clear_poly_c(self):
@@ -245,10 +342,11 @@ class VGAScreen:
         Note: This will fail if not sent during the vsync period!
         """
         self.poly_c = None
+        self.commit_scene()
 
         # Generate and send command
         new_cmd = SPIcmd(cmd=SPI_CMD_CLEAR_POLY_C, color=0, v0_x=0, v1_x=0, v2_x=0, v0_y=0, v1_y=0, v2_y=0)
-        await send_spi_cmd(cs_signal=self.dut.spi_cs, sck_signal=self.dut.spi_sck, mosi_signal=self.dut.spi_mosi, cmd=new_cmd)
+        await self.spi.send([new_cmd])
 
 
     async def clear_poly_d(self):
@@ -258,10 +356,63 @@ class VGAScreen:
         Note: This will fail if not sent during the vsync period!
         """
         self.poly_d = None
+        self.commit_scene()
 
         # Generate and send command
         new_cmd = SPIcmd(cmd=SPI_CMD_CLEAR_POLY_D, color=0, v0_x=0, v1_x=0, v2_x=0, v0_y=0, v1_y=0, v2_y=0)
-        await send_spi_cmd(cs_signal=self.dut.spi_cs, sck_signal=self.dut.spi_sck, mosi_signal=self.dut.spi_mosi, cmd=new_cmd)
+        await self.spi.send([new_cmd])
+
+
+    def apply_cmds(self, cmds: np.ndarray):
+        """
+        Update the stored polygons and background from a structured array of commands, in order
+        """
+        slots = ['poly_a', 'poly_b', 'poly_c', 'poly_d']
+        for record in cmds:
+            cmd = int(record['cmd'])
+            if cmd & SPI_CMD_WRITE_POLY_A == SPI_CMD_WRITE_POLY_A:
+                # Vertices are stored compressed by 8 on the wire
+                vertex = lambda v: np.array([int(record[v + '_x']) * 8, int(record[v + '_y']) * 8])
+                setattr(self, slots[cmd & 0x3], Polygon(v0=vertex('v0'), v1=vertex('v1'), v2=vertex('v2'),
+                                                        color=int(record['color'])))
+            elif cmd & SPI_CMD_CLEAR_POLY_A == SPI_CMD_CLEAR_POLY_A:
+                setattr(self, slots[cmd & 0x3], None)
+            elif cmd == SPI_CMD_SET_BG_COLOR:
+                self.background_color = int(record['color'])
+
+        self.commit_scene()
+
+
+    async def replay(self, stream: CommandStreamReader, name: str = 'replay', tolerance: float = 0.01):
+        """
+        Replay a command stream, one frame of commands per blanking period, checking every frame drawn from it
+
+        Frames are sent straight from the mapped file, so only the frame being sent is read in
+        """
+        for index in range(len(stream) + 1):
+            # Blanking period after the frame drawn with the previous commands
+            await self.wait_position(self.frame_count * FRAME_CYCLES + VISIBLE_N_CYCLES + 1)
+
+            if index > 0:
+                save_images(gt=self.gt_buf, gen=self.screen_buf, name=name + '_frame_' + str(index))
+                check_frame_error(self.dut, gt=self.gt_buf, gen=self.screen_buf, tolerance=tolerance)
+
+            if index == len(stream) or len(stream.frame(index)) == 0:
+                continue
+
+            self.apply_cmds(stream.frame_cmds(index))
+            await self.spi.send(stream.frame(index))
+            assert self.pos_y >= FRAME_HEIGHT, "Commands of frame " + str(index) + " did not fit in the blanking period"
+
+
+def sample_record(dut) -> int:
+    """
+    Record of the current outputs read through the GPI, in the capture file format
+    """
+    return pack_record(color=(dut.red_out.value.integer << 4) | (dut.green_out.value.integer << 2) | dut.blue_out.value.integer,
+                       hsync=dut.hsync.value.integer,
+                       vsync=dut.vsync.value.integer,
+                       int_out=dut.int_out.value.integer)
 
 
 def calc_cycles(n_cycles) -> int:
@@ -273,22 +424,22 @@ def calc_cycles(n_cycles) -> int:
 
 def save_images(gt: np.ndarray, gen: np.ndarray, name: str):
     """
-    Helper to save images
+    Helper to save images, frames of color indices are expanded to RGB here
     """
     # Save images - Only save 640x480 RGB data
     if environ['SAVE_IMGS'] == 'True':
-        gt_img = Image.fromarray(gt[0:479, 0:639, :], mode='RGB')
+        gt_img = Image.fromarray(frame_to_rgb(gt)[0:479, 0:639, :], mode='RGB')
         gt_img.save(SAVED_IMAGE_PATH + 'gt_' + name + '.png')
 
-        gen_img = Image.fromarray(gen[0:479, 0:639, :], mode='RGB')
+        gen_img = Image.fromarray(frame_to_rgb(gen)[0:479, 0:639, :], mode='RGB')
         gen_img.save(SAVED_IMAGE_PATH + 'gen_' + name + '.png')
 
 
 def check_frame_error(dut, gt: np.ndarray, gen: np.ndarray, tolerance: float):
     """
-    Helper checks absolute mean error between frames (normalized)
+    Helper checks absolute mean error between frames of color indices (normalized RGB)
     """
-    error = (np.absolute(gt[0:479, 0:639, :] - gen[0:479, 0:639, :]) / 255).mean()
+    error = (np.absolute(frame_to_rgb(gt)[0:479, 0:639, :] - frame_to_rgb(gen)[0:479, 0:639, :]) / 255).mean()
     dut._log.info("Frame error is " + str(error))
     if (error > tolerance):
         assert 1 == 0
@@ -307,6 +458,7 @@ async def reset_device(dut, screen: VGAScreen):
 
     dut.rst_n.value = 0
     await Timer(calc_cycles(10), units='ns')
+    screen.start_capture()
     dut.rst_n.value = 1
     await Timer(calc_cycles(1), units='ns')
     screen.has_been_reset = True
@@ -326,9 +478,63 @@ async def test_reset(dut):
     # Reset device
     await reset_device(dut, screen=screen)
 
-    # Clock asserts screen state signals automatically
+    # Monitor checks screen state signals automatically
     await Timer(calc_cycles(4), units='ns')
 
+    # Check outputs recorded since the last full frame
+    await screen.check_remaining()
+
+    dut._log.info("Finished")
+
+
+async def compare_capture(dut, screen: VGAScreen, n_records: int):
+    """
+    Sample the first n_records cycles out of reset through the GPI and check the capture file holds the same records
+    """
+    sampled = np.zeros(n_records, dtype=np.uint32)
+    for position in range(n_records):
+        await screen.wait_position(position)
+        sampled[position] = sample_record(dut)
+
+    # Stops the capture, which flushes it
+    await screen.check_remaining()
+
+    captured = screen.capture.records()
+    assert len(captured) >= n_records - 1, "Only " + str(len(captured)) + " records were captured"
+    mismatches = np.flatnonzero(captured != sampled[:len(captured)])
+    assert len(mismatches) == 0, str(len(mismatches)) + " captured records differ, the first at " + str(mismatches[0])
+
+
+@cocotb.test()
+async def test_capture_matches_sampling(dut):
+    """
+    Test the capture file against outputs sampled through the GPI, over two frames and again after a second reset
+    """
+    dut._log.info("Start")
+
+    # Generate screen and start clock
+    screen = VGAScreen(dut=dut, clk_signal=dut.clk, capture=True)
+    monitor = cocotb.start_soon(screen.clock())
+
+    # Reset device
+    await reset_device(dut, screen=screen)
+
+    # Two whole frames, checked by the monitor from the capture as they complete
+    await compare_capture(dut, screen, 2 * SCREEN_N_CYCLES + 1)
+    assert screen.frame_count == 2
+
+    dut._log.info("Second reset")
+
+    # A fresh screen reopens the capture file, records count from the new reset release
+    monitor.kill()
+    screen.clock_task.kill()
+    screen = VGAScreen(dut=dut, clk_signal=dut.clk, capture=True)
+    cocotb.start_soon(screen.clock())
+    await reset_device(dut, screen=screen)
+
+    await compare_capture(dut, screen, SCREEN_N_CYCLES + 1)
+    assert screen.frame_count == 1
+
     dut._log.info("Finished")
 
 
@@ -349,6 +555,10 @@ async def test_empty_screen(dut):
 
     # Run 2 whole frames of the timing to be sure
     await Timer(calc_cycles(SCREEN_N_CYCLES*2 + 1), units='ns')
+
+    # Check outputs recorded since the last full frame
+    await screen.check_remaining()
+
     dut._log.info("Finished")
 
 
@@ -558,5 +768,65 @@ async def test_draw_single_polygon_per_frame(dut):
     # Check gt vs generated to 1%
     check_frame_error(dut, gt=screen.gt_buf, gen=screen.screen_buf, tolerance=0.01)
 
+    dut._log.info("Ground truth rendered by " + str(screen.golden.max_workers) + " golden frame workers")
+
+    # Check outputs recorded since the last full frame
+    await screen.check_remaining()
+
     dut._log.info("Finished")
 
+
+def write_random_stream(path: str, n_frames: int):
+    """
+    Command stream of random on screen polygon writes, clears and background changes, a few commands per frame
+    """
+    with CommandStreamWriter(path) as stream:
+        for _ in range(n_frames):
+            cmds = make_cmds(random.randrange(1, 5))
+            for name, _, width in SPI_CMD_FIELDS[1:]:
+                cmds[name] = np.random.randint(0, 1 << width, size=len(cmds))
+
+            # Keep vertices on the visible screen
+            for name in ['v0_x', 'v1_x', 'v2_x']:
+                cmds[name] %= FRAME_WIDTH // 8
+            for name in ['v0_y', 'v1_y', 'v2_y']:
+                cmds[name] %= FRAME_HEIGHT // 8
+
+            cmds['cmd'] = [random.choice([SPI_CMD_WRITE_POLY_A, SPI_CMD_WRITE_POLY_B, SPI_CMD_WRITE_POLY_C,
+                                          SPI_CMD_WRITE_POLY_D, SPI_CMD_CLEAR_POLY_A, SPI_CMD_CLEAR_POLY_B,
+                                          SPI_CMD_CLEAR_POLY_C, SPI_CMD_CLEAR_POLY_D, SPI_CMD_SET_BG_COLOR])
+                           for _ in range(len(cmds))]
+            stream.write_frame(cmds)
+
+
+@cocotb.test()
+async def test_replay_stream(dut):
+    """
+    Test replaying a recorded command stream, a random one unless a file is given with +cmd_stream
+    """
+    dut._log.info("Start")
+
+    path = cocotb.plusargs.get('cmd_stream')
+    if path is None:
+        path = REPLAY_STREAM_PATH
+        write_random_stream(path, REPLAY_FRAMES)
+
+    # Generate screen and start clock
+    screen = VGAScreen(dut=dut, clk_signal=dut.clk)
+    cocotb.start_soon(screen.clock())
+
+    # Reset device
+    await reset_device(dut, screen=screen)
+
+    with CommandStreamReader(path) as stream:
+        dut._log.info("Replaying " + str(len(stream)) + " frames from " + path)
+        await screen.replay(stream)
+
+    # Check outputs recorded since the last full frame
+    await screen.check_remaining()
+
+    dut._log.info("Finished")
+
+
+# Profile every test above when PROFILE_TESTS=1
+profile_tests(globals())
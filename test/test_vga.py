@@ -8,6 +8,7 @@ Test VGA driver
 import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import ClockCycles, Timer
+from profiling import profile_tests
 
 # 640x480 VGA
 VGA_TOTAL_COLS = 800
@@ -145,3 +146,5 @@ async def test_vga_synchronization(dut):
     dut._log.info("Finished")
 
 
+# Profile every test above when PROFILE_TESTS=1
+profile_tests(globals())